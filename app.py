@@ -1,67 +1,178 @@
 """Flask web application with views for weather statistics site"""
+from datetime import date, datetime, time, timedelta
+from hashlib import sha1
 from os import environ, path, urandom
 from typing import Tuple, Union
+from urllib.parse import urlencode
 
 from flask import Flask as Flask
-from flask import Response, abort, redirect, render_template, request, session
+from flask import Response, abort, jsonify, redirect, render_template, request
 from werkzeug.exceptions import HTTPException
 
-from data.cite_config import today, wind_codes
-from data.fetch_db import GetStats
+from data import metrics
+from data.archive import archive_progress
+from data.cache import SharedCache
+from data.catalog import city_index
+from data.cite_config import cache_dir, today, wind_codes
+from data.db import DB_PATH, writer_engine
+from data.fetch_db import create_stats
 from data.forms import WeatherForm
+from data.histograms import ensure_histograms
 from data.load_data import create_weather_archive
+from data.periods import MAX_PERIODS, parse_periods, recurring_periods
+from data.profiling import profiled
+from data.series import get_series
+from data.warming import log_report_request
 
 SECRET_KEY = environ.get("SECRET_KEY") or urandom(24).hex()
 app = Flask(__name__)
 app.config["SECRET_KEY"] = SECRET_KEY
+page_cache = SharedCache(cache_dir, "page")
 
 
 @app.route("/", methods=["GET", "POST"])
 @app.route("/index", methods=["GET", "POST"])
 def index() -> Union[Response, str]:
     """Generates site main page with form for period and city input.
-    In case of form validation redirects to city report page.
-    Adds data from form into Flask "session" to share with another flask views.
+    In case of form validation redirects to city report page with period
+    in URL parameters.
 
     """
     form = WeatherForm()
     if form.validate_on_submit():
-        city = form.city.data
-        session["city"] = city
-        session["date_from"] = request.form["date_from"]
-        session["date_until"] = request.form["date_until"]
-        return redirect(f"/reports/{city}")
+        period = {
+            "from": request.form["date_from"],
+            "until": request.form["date_until"],
+        }
+        return redirect(f"/reports/{form.city.data}?{urlencode(period)}")
     return render_template("index.html", form=form, today=today)
 
 
+def seconds_until_update() -> int:
+    """Returns number of seconds until next daily database update at 00:00 UTC.
+
+    :return: seconds until next midnight UTC.
+
+    """
+    now = datetime.utcnow()
+    update = datetime.combine(now.date() + timedelta(days=1), time())
+    return int((update - now).total_seconds())
+
+
 @app.route("/reports/<string:city>")
-def report(city: str) -> str:
+@profiled
+@metrics.timed(metrics.report_seconds)
+def report(city: str) -> Response:
     """
     Generates site page - report for chosen city and period with weather
-    statistics from Flask "session" parameters.
+    statistics, period is provided in "from" and "until" URL parameters.
+    Reports for periods that end in the past are rendered once, saved in
+    shared page cache and served with ETag and Cache-Control headers, so
+    repeated requests skip both database queries and template rendering.
 
     """
-    stats = GetStats()
-    city = session["city"]
-    date_from = session["date_from"]
-    date_until = session["date_until"]
+    date_from, date_until = request.args.get("from"), request.args.get("until")
     try:
-        params = {
-            "max_temp": stats.get_max_temp(city, date_from, date_until),
-            "min_temp": stats.get_min_temp(city, date_from, date_until),
-            "avg_temp": stats.get_avg_temp(city, date_from, date_until),
-            "wind_speed": stats.get_wind_speed(city, date_from, date_until),
-            "wind_dir": stats.get_wind_dir(city, date_from, date_until),
-            "date_temp": stats.get_date_temp(city, date_from, date_until),
-            "precipitations": stats.precipitations(city, date_from, date_until),
-            "common_weather": stats.common_weather(city, date_from, date_until),
-            "years_max": stats.get_years_max(city, date_from, date_until),
-            "years_min": stats.get_years_min(city, date_from, date_until),
-            "wind_codes": wind_codes,
-        }
-    except Exception:
-        abort(500)
-    return render_template("report.html", city=city, params=params)
+        cacheable = date.fromisoformat(date_until) < today
+        date.fromisoformat(date_from)
+    except (TypeError, ValueError):
+        abort(404)
+    log_report_request(city, date_from, date_until)
+    key = (city, date_from, date_until)
+    generation = page_cache.generation()
+    cached = page_cache.get(key) if cacheable else None
+    if cached is None:
+        stats = create_stats()
+        try:
+            params = dict(stats.get_report(city, date_from, date_until))
+        except Exception:
+            abort(500)
+        params["wind_codes"] = wind_codes
+        page = render_template("report.html", city=city, params=params)
+        cached = {"page": page, "etag": sha1(page.encode()).hexdigest()}
+        if cacheable:
+            page_cache.set(key, cached, generation)
+    response = Response(cached["page"], mimetype="text/html")
+    if cacheable:
+        response.set_etag(cached["etag"])
+        response.cache_control.public = True
+        response.cache_control.max_age = seconds_until_update()
+        response.make_conditional(request)
+    return response
+
+
+@app.route("/series/<string:city>")
+def series(city: str) -> Response:
+    """
+    Returns JSON with daily temperature, wind and precipitations series for
+    report charts, period is provided in "from" and "until" URL parameters.
+    Every series is downsampled to "points" URL parameter number of points.
+
+    """
+    date_from, date_until = request.args.get("from"), request.args.get("until")
+    points = min(max(request.args.get("points", 500, type=int), 2), 2000)
+    try:
+        cacheable = date.fromisoformat(date_until) < today
+        date.fromisoformat(date_from)
+    except (TypeError, ValueError):
+        abort(404)
+    response = jsonify(get_series(city, date_from, date_until, points))
+    if cacheable:
+        response.cache_control.public = True
+        response.cache_control.max_age = seconds_until_update()
+    return response
+
+
+@app.route("/compare/<string:city>")
+def compare(city: str) -> Response:
+    """
+    Returns JSON table with weather statistics of city for every compared
+    period. Periods are provided either as "months" URL parameter with
+    recurring months of every year, e.g. "7" or "12,1,2", or as "periods" URL
+    parameter with "begin:end" dates ranges separated by commas.
+
+    """
+    try:
+        if "months" in request.args:
+            months = [int(month) for month in request.args["months"].split(",")]
+            periods = recurring_periods(months)
+        else:
+            periods = parse_periods(request.args["periods"])
+    except (KeyError, ValueError):
+        abort(404)
+    if not periods or len(periods) > MAX_PERIODS:
+        abort(404)
+    stats = create_stats().get_periods(city, periods)
+    response = jsonify({"city": city, "periods": stats})
+    if max(date.fromisoformat(end) for _, end in periods) < today:
+        response.cache_control.public = True
+        response.cache_control.max_age = seconds_until_update()
+    return response
+
+
+@app.route("/metrics")
+def metrics_page() -> Response:
+    """Returns application metrics in Prometheus format if metrics are enabled"""
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.export(), mimetype=metrics.content_type)
+
+
+@app.route("/cities")
+def cities_search() -> Response:
+    """
+    Returns JSON list with city names found by prefix from "q" URL parameter
+    for city input typeahead on index page.
+
+    """
+    limit = min(request.args.get("limit", 10, type=int), 50)
+    return jsonify(city_index().search(request.args.get("q", ""), limit))
+
+
+@app.route("/archive/progress")
+def archive_progress_page() -> Response:
+    """Returns initial archive build progress by chunks in JSON format"""
+    return jsonify(archive_progress())
 
 
 @app.errorhandler(404)
@@ -77,6 +188,8 @@ def server_error(error: HTTPException) -> Tuple[str, int]:
 
 
 if __name__ == "__main__":
-    if not path.isfile("/db/statistic.db"):
+    if not path.isfile(DB_PATH):
         create_weather_archive()
+    else:
+        ensure_histograms(writer_engine)
     app.run(host="0.0.0.0", debug=True)
@@ -0,0 +1 @@
+"""Benchmarks for weather statistics site, run from project root directory"""
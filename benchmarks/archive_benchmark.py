@@ -0,0 +1,97 @@
+"""
+End-to-end benchmark for weather archive build against local mock diary
+server. Starts benchmarks.mock_diary with provided latency and error options,
+builds archive into temporary database via create_weather_archive and saves
+throughput into benchmarks/results/archive.json. Run from project directory:
+
+    python -m benchmarks.archive_benchmark --latency 0.05 --error-rate 0.01
+
+"""
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from json import dump
+from os import environ, makedirs, path, remove
+from sqlite3 import connect
+from subprocess import DEVNULL, Popen, run
+from sys import executable
+from time import perf_counter, sleep
+from typing import Dict
+
+from data.cite_config import cities, today
+
+RESULTS_DIR = "benchmarks/results"
+build_script = "from data.load_data import create_weather_archive as c; c()"
+
+
+def start_server(args: Namespace) -> Popen:
+    """Starts mock diary server in subprocess with provided options.
+
+    :param args: parsed command line arguments.
+    :return: server process.
+
+    """
+    command = [executable, "-m", "benchmarks.mock_diary", "--port", str(args.port)]
+    command += ["--latency", str(args.latency), "--error-rate", str(args.error_rate)]
+    server = Popen(command, stdout=DEVNULL, stderr=DEVNULL)
+    sleep(args.startup)
+    return server
+
+
+def build_archive(args: Namespace, db_path: str) -> Dict:
+    """
+    Builds weather archive from mock server into new database in subprocess
+    and measures elapsed time, loaded rows and throughput.
+
+    :param args: parsed command line arguments.
+    :param db_path: path of database to create.
+    :return: dict with benchmark results.
+
+    """
+    if path.isfile(db_path):
+        remove(db_path)
+    env = dict(environ, DB_PATH=db_path)
+    env["WEATHER_SOURCE_URL"] = f"http://127.0.0.1:{args.port}"
+    start = perf_counter()
+    run([executable, "-c", build_script], env=env, stdout=DEVNULL, check=True)
+    seconds = perf_counter() - start
+    with connect(db_path) as connection:
+        rows = connection.execute("SELECT count(*) FROM statistic").fetchone()[0]
+    pages = len(cities) * ((today.year - 2010) * 12 + today.month)
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "seconds": seconds,
+        "pages": pages,
+        "rows": rows,
+        "pages_per_sec": pages / seconds,
+        "rows_per_sec": rows / seconds,
+    }
+
+
+def parse_args() -> Namespace:
+    """Parses benchmark command line arguments"""
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--startup", type=float, default=2.0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Runs archive build benchmark and saves results"""
+    args = parse_args()
+    makedirs(RESULTS_DIR, exist_ok=True)
+    server = start_server(args)
+    try:
+        results = build_archive(args, path.join(RESULTS_DIR, "archive.db"))
+    finally:
+        server.terminate()
+    print(*(f"{key}: {value}" for key, value in results.items()), sep="\n")
+    with open(path.join(RESULTS_DIR, "archive.json"), "w") as file:
+        dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
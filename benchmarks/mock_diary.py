@@ -0,0 +1,189 @@
+"""
+Local stand-in for weather source website diary pages to load test scraper
+offline. Serves month pages with the same "data_block" table structure as
+source website for any "/<city_code>/<year>/<month>/" URL. Pages are generated
+from synthetic data or loaded from directory with recorded pages. Run:
+
+    python -m benchmarks.mock_diary --port 8080 --latency 0.05 --error-rate 0.01
+
+and set WEATHER_SOURCE_URL=http://localhost:8080 for scraper processes.
+
+"""
+from argparse import ArgumentParser, Namespace
+from asyncio import sleep
+from datetime import date
+from os import path
+from random import Random
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+from data.cite_config import cities
+from data.fetch_db import last_day
+from data.synthetic import city_weather
+
+directions = [("N", "С"), ("S", "Ю"), ("W", "З"), ("E", "В")]
+page_template = """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0 Transitional//EN">
+<html>
+<head><title>GISMETEO.RU: Gismeteo.Дневник</title></head>
+<body>
+<div id=page><div id=page_content>
+<div id=data_block>
+<table align=center valign=top border=0>
+<tr>
+<th class='first_row first' rowspan=2>Число</th>
+<th class='first_row first_in_group' colspan=5><label>День</label></th>
+<th class='first_row first_in_group last' colspan=5><label>Вечер</label></th>
+</tr>
+<tbody>
+{rows}
+</tbody>
+</table>
+</div>
+</div></div>
+</body>
+</html>
+"""
+row_template = """<tr align="center">
+<td class=first>{day}</td>
+<td class='first_in_group'>{max_temp}</td>
+<td>745</td>
+<td><img src=//st.gismeteo.ru/static/diary/img/sun.png /></td>
+<td>{weather}</td>
+<td><span>{wind}</span></td>
+<td class='first_in_group'>{min_temp}</td>
+<td>745</td>
+<td><img src=//st.gismeteo.ru/static/diary/img/sun.png /></td>
+<td></td>
+<td><span>{wind}</span></td>
+</tr>"""
+
+
+def wind_text(w_direction: str, w_speed: str) -> str:
+    """Translates wind data from synthetic row to source website format.
+
+    :param w_direction: wind direction in english.
+    :param w_speed: wind speed, e.g. "3m/s".
+    :return: wind information in russian language.
+
+    """
+    if w_direction == "Calm":
+        return "Ш"
+    for eng, rus in directions:
+        w_direction = w_direction.replace(eng, rus)
+    return f"{w_direction} {w_speed.replace('m/s', 'м/с')}"
+
+
+def render_page(rows: List[Tuple[str, ...]]) -> str:
+    """Renders month page with weather table for provided synthetic rows.
+
+    :param rows: list with synthetic rows for month.
+    :return: page text.
+
+    """
+    table_rows = []
+    for _, day, max_temp, min_temp, weather, w_direction, w_speed in rows:
+        image = f"<img src=//st.gismeteo.ru/static/diary/img/{weather}.png />"
+        table_rows.append(
+            row_template.format(
+                day=day.day,
+                max_temp=max_temp,
+                min_temp=min_temp,
+                weather=image if weather else "",
+                wind=wind_text(w_direction, w_speed),
+            )
+        )
+    return page_template.format(rows="\n".join(table_rows))
+
+
+class MockDiary:
+    """
+    Request handler for mock diary server. Keeps generated city rows in memory
+    and injects latency and error responses according to provided options.
+
+    """
+
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.rng = Random(args.seed)
+        self.city_months: Dict[str, Dict[Tuple[int, int], List[Tuple]]] = {}
+
+    def month_rows(self, city: str, year: int, month: int) -> List[Tuple]:
+        """Returns synthetic rows for city and month, generates city on demand.
+
+        :param city: city name.
+        :param year: page year.
+        :param month: page month.
+        :return: list with synthetic rows.
+
+        """
+        if city not in self.city_months:
+            months = self.city_months[city] = {}
+            rows = city_weather(city, date(2010, 1, 1), last_day, self.args.seed)
+            for row in rows:
+                months.setdefault((row[1].year, row[1].month), []).append(row)
+        return self.city_months[city].get((year, month), [])
+
+    def recorded_page(self, code: str, year: str, month: str) -> str:
+        """Returns recorded page text from pages directory if it exists"""
+        if not self.args.pages:
+            return ""
+        page_path = path.join(self.args.pages, code, year, f"{month}.html")
+        if not path.isfile(page_path):
+            return ""
+        with open(page_path, encoding="utf-8") as page:
+            return page.read()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Returns month page, error response or 404 for future months.
+
+        :param request: aiohttp request.
+        :return: aiohttp response.
+
+        """
+        jitter = self.args.jitter * self.rng.uniform(-1, 1)
+        await sleep(max(self.args.latency * (1 + jitter), 0))
+        if self.rng.random() < self.args.error_rate:
+            return web.Response(status=self.rng.choice(self.args.error_status))
+        code, year, month = (
+            request.match_info[key] for key in ("code", "year", "month")
+        )
+        page = self.recorded_page(code, year, month)
+        if page:
+            return web.Response(text=page, content_type="text/html")
+        if (int(year), int(month)) > (last_day.year, last_day.month):
+            raise web.HTTPNotFound()
+        rows = self.month_rows(cities.get(code, code), int(year), int(month))
+        return web.Response(text=render_page(rows), content_type="text/html")
+
+
+def parse_args() -> Namespace:
+    """Parses mock server command line arguments"""
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, nargs="+", default=[503])
+    parser.add_argument("--pages", help="directory with recorded pages")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def create_app(args: Namespace) -> web.Application:
+    """Creates aiohttp application for mock diary server.
+
+    :param args: mock server options.
+    :return: aiohttp application.
+
+    """
+    diary = MockDiary(args)
+    app = web.Application()
+    app.router.add_get(r"/{code}/{year:\d+}/{month:\d+}/", diary.handle)
+    return app
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    web.run_app(create_app(options), host=options.host, port=options.port)
@@ -0,0 +1,241 @@
+"""
+Benchmark suite for GetStats methods and report page on synthetic datasets of
+different sizes and for different report ranges. Run from project directory:
+
+    python -m benchmarks.stats_benchmark --sizes 15x16 150x16
+    python -m benchmarks.stats_benchmark --save-baseline
+    python -m benchmarks.stats_benchmark --backend duckdb
+
+Results are saved into benchmarks/results/latest.json and compared with
+benchmarks/results/baseline.json if it exists. Any increase of SQL queries
+number or latency regression above tolerance fails benchmark with exit code 1.
+
+"""
+from argparse import ArgumentParser, Namespace
+from datetime import date, timedelta
+from functools import partial
+from json import dump, load
+from os import makedirs, path
+from statistics import median
+from sys import exit
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+import app as web
+from data import duck_db, fetch_db, warming
+from data.cache import SharedCache
+from data.fetch_db import last_day
+from data.histograms import ensure_histograms
+from data.models import Session
+from data.synthetic import populate, synthetic_cities
+
+RESULTS_DIR = "benchmarks/results"
+stats_methods = (
+    "get_max_temp",
+    "get_min_temp",
+    "get_avg_temp",
+    "get_wind_speed",
+    "get_wind_dir",
+    "get_date_temp",
+    "precipitations",
+    "common_weather",
+    "get_years_max",
+    "get_years_min",
+    "get_distribution",
+)
+
+
+class QueryCounter:
+    """Counts SQL statements executed by provided SQLAlchemy engine"""
+
+    def __init__(self, engine: Engine) -> None:
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.increase)
+
+    def increase(self, *args) -> None:
+        self.count += 1
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """Parses dataset size string "<cities>x<years>" into tuple with numbers.
+
+    :param size: dataset size string, e.g. "15x16".
+    :return: tuple with number of cities and years.
+
+    """
+    cities_number, years = size.split("x")
+    return int(cities_number), int(years)
+
+
+def build_database(cities_number: int, years: int) -> Engine:
+    """
+    Creates SQLite database with synthetic data for provided number of cities
+    and years until last_day. Database file is reused if it already exists,
+    because generated data is deterministic.
+
+    :param cities_number: number of cities in dataset.
+    :param years: number of years in dataset.
+    :return: SQLAlchemy engine for created database.
+
+    """
+    name = f"bench-{cities_number}x{years}-{last_day}.db"
+    db_path = path.join(RESULTS_DIR, name)
+    exists = path.isfile(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    if not exists:
+        first_day = date(last_day.year - years + 1, 1, 1)
+        populate(engine, synthetic_cities(cities_number), first_day, last_day)
+    ensure_histograms(engine)
+    return engine
+
+
+def measure(func: Callable, counter: QueryCounter, repeat: int) -> Dict:
+    """Runs function several times and measures latency and SQL queries number.
+
+    :param func: function without arguments to measure.
+    :param counter: QueryCounter for benchmark database engine.
+    :param repeat: number of function runs.
+    :return: dict with median seconds and queries number per run.
+
+    """
+    timings = []
+    counter.count = 0
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return {"seconds": median(timings), "queries": counter.count // repeat}
+
+
+def report_page(city: str, begin: str, end: str) -> Callable:
+    """Returns function that requests report page via Flask test client.
+
+    :param city: city for report.
+    :param begin: report start date.
+    :param end: report end date.
+    :return: function without arguments that loads report page.
+
+    """
+    client = web.app.test_client()
+
+    def request() -> None:
+        response = client.get(f"/reports/{city}?from={begin}&until={end}")
+        assert response.status_code == 200, response.status
+
+    return request
+
+
+def run_benchmarks(args: Namespace) -> Dict[str, Dict]:
+    """
+    Runs all benchmarks for provided dataset sizes and report ranges. Page and
+    statistics caches and reports access log are disabled, so repeated report
+    requests measure statistics computation instead of cache hits.
+
+    :param args: parsed command line arguments.
+    :return: dict with benchmark names and results.
+
+    """
+    results = {}
+    web.page_cache = SharedCache(None, "page")
+    fetch_db.stats_cache = SharedCache(None, "stats")
+    warming.cache_dir = None
+    fetch_db.stats_backend = args.backend
+    stats = fetch_db.create_stats()
+    for size in args.sizes:
+        cities_number, years = parse_size(size)
+        engine = build_database(cities_number, years)
+        Session.configure(bind=engine)
+        if args.backend == "duckdb":
+            name = f"bench-{cities_number}x{years}-{last_day}.duckdb"
+            duck_db.database_path = path.join(RESULTS_DIR, name)
+            duck_db.rebuild_mirror(engine)
+        counter = QueryCounter(engine)
+        city = synthetic_cities(1)[0]
+        for days in args.ranges:
+            first_day = date(last_day.year - years + 1, 1, 1)
+            if days != "full":
+                first_day = last_day - timedelta(days=int(days) - 1)
+            begin, end = first_day.isoformat(), last_day.isoformat()
+            benchmarks = [
+                (method, partial(getattr(stats, method), city, begin, end))
+                for method in stats_methods
+            ]
+            benchmarks.append(("report", report_page(city, begin, end)))
+            for name, func in benchmarks:
+                key = f"{size}/{days}/{name}"
+                if args.backend != "sqlite":
+                    key = f"{args.backend}/{key}"
+                results[key] = measure(func, counter, args.repeat)
+                print(
+                    f"{key:<40}{results[key]['seconds'] * 1000:>10.2f} ms"
+                    f"{results[key]['queries']:>6} queries"
+                )
+        engine.dispose()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compares benchmark results with baseline. Latency regression is reported
+    only if it is greater than tolerance and than 1 ms to ignore timer noise.
+
+    :param results: dict with benchmark results.
+    :param baseline: dict with baseline benchmark results.
+    :param tolerance: allowed relative latency increase.
+    :return: list with regression descriptions.
+
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        if result["queries"] > base["queries"]:
+            regressions.append(
+                f"{key}: queries {base['queries']} -> {result['queries']}"
+            )
+        limit = max(base["seconds"] * (1 + tolerance), base["seconds"] + 0.001)
+        if result["seconds"] > limit:
+            regressions.append(
+                f"{key}: latency {base['seconds'] * 1000:.2f} ms -> "
+                f"{result['seconds'] * 1000:.2f} ms"
+            )
+    return regressions
+
+
+def parse_args() -> Namespace:
+    """Parses benchmark command line arguments"""
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", nargs="+", default=["15x16", "150x16"])
+    parser.add_argument("--ranges", nargs="+", default=["7", "30", "365", "full"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", choices=["sqlite", "duckdb"], default="sqlite")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Runs benchmarks, saves results and fails on regressions from baseline"""
+    args = parse_args()
+    makedirs(RESULTS_DIR, exist_ok=True)
+    results = run_benchmarks(args)
+    result_name = "baseline.json" if args.save_baseline else "latest.json"
+    with open(path.join(RESULTS_DIR, result_name), "w") as file:
+        dump(results, file, indent=2)
+    baseline_path = path.join(RESULTS_DIR, "baseline.json")
+    if args.save_baseline or not path.isfile(baseline_path):
+        return None
+    with open(baseline_path) as file:
+        regressions = compare(results, load(file), args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS FROM BASELINE:", *regressions, sep="\n")
+        exit(1)
+    print("\nNo regressions from baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Defines celery tasks for distributed initial archive build. Archive is split
+into (city, year) chunks, every chunk is loaded by separate task, so scaling
+"celery" service parallelizes archive build. Run from project directory:
+
+    python -m celery_task.archive_worker build
+    python -m celery_task.archive_worker progress
+    python -m celery_task.archive_worker retry
+
+"""
+from argparse import ArgumentParser
+from json import dumps
+from logging import getLogger
+from typing import List
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from celery_task.daily_worker import celery
+from data import archive, cite_config
+from data.fetch_db import stats_cache
+from data.load_data import load_chunk
+from data.metrics import push_metrics
+
+logger = getLogger(__name__)
+
+
+def enqueue(chunks: List[archive.Chunk]) -> int:
+    """Sends build_chunk tasks for provided chunks into queue.
+
+    :param chunks: list with (city code, year) tuples.
+    :return: number of sent tasks.
+
+    """
+    for city, year in chunks:
+        build_chunk.delay(city, year)
+    return len(chunks)
+
+
+@celery.task
+def build_archive() -> int:
+    """Task for celery worker.
+    Schedules all not yet loaded archive chunks.
+
+    """
+    return enqueue(archive.schedule_chunks())
+
+
+@celery.task
+def retry_failed() -> int:
+    """Task for celery worker.
+    Schedules again all chunks which failed after all retry attempts and
+    chunks left running or retrying longer than ARCHIVE_CHUNK_TIMEOUT.
+
+    """
+    return enqueue(archive.retry_chunks())
+
+
+@celery.task(bind=True, max_retries=3)
+def build_chunk(self, city: str, year: int) -> None:
+    """Task for celery worker.
+    Loads and saves weather data of one city for one year. On errors chunk is
+    marked retrying and task is retried, after last retry chunk is marked
+    failed until it is scheduled again with retry_failed task.
+    Starts finish_archive task after last chunk is loaded or failed.
+
+    """
+    archive.set_status(city, year, archive.RUNNING)
+    try:
+        archive.save_chunk(city, year, load_chunk(city, year))
+    except Exception as exc:
+        retry = self.request.retries < self.max_retries
+        status = archive.RETRYING if retry else archive.FAILED
+        archive.set_status(city, year, status, repr(exc))
+        if retry:
+            raise self.retry(exc=exc, countdown=60)
+        finish_if_complete()
+        raise
+    finally:
+        push_metrics("build_chunk")
+    finish_if_complete()
+
+
+def finish_if_complete() -> None:
+    """
+    Starts finish_archive task if no chunks are left to load. Progress errors
+    are only logged, so they don't fail task of already saved chunk.
+
+    """
+    try:
+        complete = archive.is_complete(archive.archive_progress())
+    except SQLAlchemyError:
+        logger.exception("Failed to check archive build progress")
+        return None
+    if complete:
+        finish_archive.delay()
+
+
+@celery.task
+def finish_archive() -> None:
+    """Task for celery worker.
+    Rebuilds DuckDB mirror if it is selected as statistics backend and
+    invalidates statistics cache after all chunks are loaded.
+
+    """
+    if cite_config.stats_backend == "duckdb":
+        from data.db import engine
+        from data.duck_db import rebuild_mirror
+
+        rebuild_mirror(engine)
+    stats_cache.invalidate()
+
+
+def main() -> None:
+    """Schedules archive build tasks or prints archive build progress"""
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["build", "progress", "retry"])
+    command = parser.parse_args().command
+    if command == "build":
+        print(f"Scheduled chunks: {build_archive()}")
+    elif command == "retry":
+        print(f"Scheduled chunks: {retry_failed()}")
+    else:
+        print(dumps(archive.archive_progress(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
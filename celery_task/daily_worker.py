@@ -1,12 +1,23 @@
 """Defines celery task for workers and daily schedule for beats"""
+from os import environ
+
 from celery import Celery
 from celery.schedules import crontab
 from requests import HTTPError
 from sqlalchemy.exc import SQLAlchemyError
 
+from data import cite_config
 from data.add_today import add_today_weather
+from data.cite_config import access_log_days, warm_periods, warm_top
+from data.fetch_db import stats_cache
+from data.metrics import push_metrics
+from data.warming import warm_cache
 
-celery = Celery("celery_task.daily_worker")
+celery = Celery(
+    "celery_task.daily_worker",
+    broker=environ.get("CELERY_BROKER"),
+    include=["celery_task.archive_worker"],
+)
 celery.conf.beat_schedule = {
     "update_db_daily": {
         "task": "celery_task.daily_worker.daily_update",
@@ -20,10 +31,34 @@ celery.conf.timezone = "UTC"
 def daily_update(self) -> None:
     """Task for celery worker.
     Runs daily "add_today_weather" function which adds new weather data into
-    database for all cities.
+    database for all cities, rebuilds DuckDB mirror if it is selected as
+    statistics backend and marked stale, invalidates statistics cache shared
+    by web application workers and starts cache warming task.
+    Pushes collected metrics to Pushgateway if enabled.
 
     """
     try:
         add_today_weather()
+        if cite_config.stats_backend == "duckdb":
+            from data.db import engine
+            from data.duck_db import refresh_mirror
+
+            refresh_mirror(engine)
+        stats_cache.invalidate()
     except (HTTPError, SQLAlchemyError) as exc:
         raise self.retry(exc=exc, countdown=(60 * 30))
+    finally:
+        push_metrics("daily_update")
+    warm_reports.delay()
+
+
+@celery.task
+def warm_reports() -> int:
+    """Task for celery worker.
+    Precomputes statistics for standard and popular report periods after
+    daily update, so first visitors get cached results.
+
+    """
+    warmed = warm_cache(warm_periods, warm_top, access_log_days)
+    push_metrics("warm_reports")
+    return warmed
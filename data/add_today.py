@@ -6,8 +6,9 @@ from requests import get
 
 from data.cite_config import cities, headers, url_main
 from data.fetch_db import last_day
-from data.models import Stat
+from data.metrics import increase, page_responses, page_seconds, timer
 from data.soup_parser import parse_data
+from data.writer import BatchWriter
 
 
 def city_last_url(city_code: str) -> str:
@@ -33,7 +34,8 @@ def load_page(url: str) -> str:
     :return: page text data.
 
     """
-    with get(url, headers=headers) as response:
+    with timer(page_seconds, "daily"), get(url, headers=headers) as response:
+        increase(page_responses, "daily", str(response.status_code))
         return response.text
 
 
@@ -68,5 +70,6 @@ def add_today_weather() -> None:
         city_url = city_last_url(city)
         city_weather_page = load_page(city_url)
         _, *weather_data = get_last_weather(city_weather_page)
-        last_weather_data.append(Stat(cities[city], last_day, *weather_data))
-    Stat.add_commit(last_weather_data)
+        last_weather_data.append((cities[city], last_day, *weather_data))
+    with BatchWriter() as writer:
+        writer.submit(last_weather_data)
@@ -0,0 +1,199 @@
+"""
+Progress tracking for initial weather archive build split into chunks - all
+pages of one city for one year. Chunks are loaded by Celery tasks
+(celery_task.archive_worker), chunk rows and its "done" status are saved in
+one transaction, so chunk is either fully saved or can be safely retried.
+Failed chunk waits for Celery retry in "retrying" status and is marked
+"failed" after the last retry. Chunks left "running" or "retrying" longer than
+ARCHIVE_CHUNK_TIMEOUT seconds (e.g. by killed worker) are scheduled again.
+
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, inspect
+
+from data.cite_config import chunk_timeout, cities, today
+from data.db import Base, Session, WriterSession, writer_engine
+from data.histograms import replace_year
+from data.metrics import observe, rows_written
+from data.models import ArchiveChunk, Stat
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+RETRYING = "retrying"
+OUTSTANDING = (PENDING, RUNNING, RETRYING)
+Chunk = Tuple[str, int]
+
+
+def all_chunks() -> List[Chunk]:
+    """Returns (city code, year) chunks for all cities from 2010 till today.
+
+    :return: list with chunks tuples.
+
+    """
+    years = range(2010, int(today.year) + 1)
+    return [(city, year) for city in cities for year in years]
+
+
+def reclaim_stale(session: Session) -> List[Chunk]:
+    """
+    Marks chunks which are running or waiting for retry longer than chunk
+    timeout as pending, e.g. chunks of killed workers. Doesn't commit.
+
+    :param session: SQLAlchemy writer session.
+    :return: list with reclaimed chunks tuples.
+
+    """
+    expired = datetime.utcnow() - timedelta(seconds=chunk_timeout)
+    stale = session.query(ArchiveChunk).filter(
+        ArchiveChunk.status.in_((RUNNING, RETRYING)), ArchiveChunk.updated < expired
+    )
+    chunks = []
+    for chunk in stale:
+        chunk.status = PENDING
+        chunks.append((chunk.city, chunk.year))
+    return chunks
+
+
+def schedule_chunks() -> List[Chunk]:
+    """
+    Saves not yet tracked chunks as pending and returns all pending chunks,
+    including stale running chunks, so repeated scheduling doesn't load done
+    chunks again.
+
+    :return: list with pending chunks tuples.
+
+    """
+    Base.metadata.create_all(writer_engine)
+    session = WriterSession()
+    try:
+        tracked = {
+            tuple(row) for row in session.query(ArchiveChunk.city, ArchiveChunk.year)
+        }
+        new = [ArchiveChunk(*chunk) for chunk in all_chunks() if chunk not in tracked]
+        session.add_all(new)
+        reclaim_stale(session)
+        pending = session.query(ArchiveChunk.city, ArchiveChunk.year).filter(
+            ArchiveChunk.status == PENDING
+        )
+        chunks = [tuple(chunk) for chunk in pending]
+        session.commit()
+    finally:
+        session.close()
+    return chunks
+
+
+def retry_chunks() -> List[Chunk]:
+    """Marks all failed and stale running chunks as pending again.
+
+    :return: list with chunks tuples to load again.
+
+    """
+    session = WriterSession()
+    try:
+        chunks = reclaim_stale(session)
+        failed = session.query(ArchiveChunk).filter(ArchiveChunk.status == FAILED)
+        for chunk in failed:
+            chunk.status = PENDING
+            chunks.append((chunk.city, chunk.year))
+        session.commit()
+    finally:
+        session.close()
+    return chunks
+
+
+def set_status(city: str, year: int, status: str, error: Optional[str] = None) -> None:
+    """
+    Changes chunk status. Attempts counter is increased when chunk loading
+    starts.
+
+    :param city: URL code for city.
+    :param year: chunk year.
+    :param status: new chunk status.
+    :param error: error description for failed chunk.
+    :return: None.
+
+    """
+    session = WriterSession()
+    try:
+        chunk = session.query(ArchiveChunk).filter_by(city=city, year=year).one()
+        chunk.status, chunk.error = status, error
+        if status == RUNNING:
+            chunk.attempts += 1
+        session.commit()
+    finally:
+        session.close()
+
+
+def save_chunk(city: str, year: int, rows: List[Tuple]) -> None:
+    """
+    Replaces chunk weather data and month histograms with provided rows and
+    marks chunk as done in one transaction.
+
+    :param city: URL code for city.
+    :param year: chunk year.
+    :param rows: list with Stat arguments tuples.
+    :return: None.
+
+    """
+    session = WriterSession()
+    try:
+        days = (date(year, 1, 1), date(year, 12, 31))
+        session.query(Stat).filter(
+            Stat.city == cities[city], Stat.day.between(*days)
+        ).delete(synchronize_session=False)
+        session.add_all([Stat(*row) for row in rows])
+        replace_year(session, cities[city], year, rows)
+        chunk = session.query(ArchiveChunk).filter_by(city=city, year=year).one()
+        chunk.status, chunk.error = DONE, None
+        session.commit()
+    finally:
+        session.close()
+    observe(rows_written, len(rows))
+
+
+def archive_progress() -> Dict:
+    """
+    Returns archive build progress: number of chunks per status and failures.
+    Uses only reader session, so progress is available during archive build.
+
+    :return: dict with chunks counts and list with failed chunks.
+
+    """
+    session = Session()
+    try:
+        if not inspect(session.get_bind()).has_table(ArchiveChunk.__tablename__):
+            counts, failed = {}, []
+        else:
+            counts = dict(
+                session.query(ArchiveChunk.status, func.count()).group_by(
+                    ArchiveChunk.status
+                )
+            )
+            failed = session.query(ArchiveChunk).filter(ArchiveChunk.status == FAILED)
+        failures = [
+            {
+                "city": chunk.city,
+                "year": chunk.year,
+                "attempts": chunk.attempts,
+                "error": chunk.error,
+            }
+            for chunk in failed
+        ]
+    finally:
+        session.close()
+    statuses = (PENDING, RUNNING, RETRYING, DONE, FAILED)
+    progress = {status: counts.get(status, 0) for status in statuses}
+    progress["total"] = sum(counts.values())
+    progress["failures"] = failures
+    return progress
+
+
+def is_complete(progress: Dict) -> bool:
+    """Checks if no chunks are left to load or to retry by Celery.
+
+    :param progress: archive build progress from archive_progress.
+    :return: True if all chunks are done or failed after all retries.
+
+    """
+    return progress["total"] > 0 and not any(progress[s] for s in OUTSTANDING)
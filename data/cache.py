@@ -0,0 +1,169 @@
+"""
+File-backed cache shared by all processes that use the same cache directory:
+WSGI workers, Celery workers and scripts. Values are stored as JSON files and
+written atomically via temporary file and rename, so readers never see
+partially written values. Cache is disabled if CACHE_DIR is not set.
+Computations of the same value in different processes are serialized with
+per key lock files, so waiting processes get value from cache instead of
+computing it again.
+
+"""
+from contextlib import contextmanager
+from fcntl import LOCK_EX, LOCK_NB, LOCK_UN, flock
+from hashlib import sha1
+from json import dump, load
+from os import makedirs, path, remove, replace, scandir
+from shutil import rmtree
+from tempfile import NamedTemporaryFile
+from time import monotonic, sleep, time_ns
+from typing import Any, Generator, Hashable, Optional
+
+from data.metrics import record_cache
+
+
+class SharedCache:
+    """
+    Creates cache with provided name in cache directory. All caches in the
+    same directory share generation number: cache entries are stored in
+    generation subdirectory, so invalidation (e.g. after daily ingest) makes
+    all previous entries unreachable for every process at once.
+
+    :param directory: cache directory path, cache is disabled if None.
+    :param name: cache name used for keys namespace and metrics.
+
+    """
+
+    def __init__(self, directory: Optional[str], name: str) -> None:
+        self.directory = directory
+        self.name = name
+
+    def generation(self) -> str:
+        """Returns current cache generation from generation file.
+
+        :return: generation string, "0" if cache was never invalidated or
+        cache is disabled.
+
+        """
+        if not self.directory:
+            return "0"
+        try:
+            with open(path.join(self.directory, "generation")) as file:
+                return file.read().strip() or "0"
+        except FileNotFoundError:
+            return "0"
+
+    def key_path(self, key: Hashable, generation: Optional[str] = None) -> str:
+        """Returns file path for key in provided or current cache generation.
+
+        :param key: cache key, its repr is hashed to file name.
+        :param generation: cache generation, current generation if None.
+        :return: path of cache file.
+
+        """
+        generation = generation or self.generation()
+        return path.join(self.directory, generation, f"{self.digest(key)}.json")
+
+    def digest(self, key: Hashable) -> str:
+        """Returns hash of cache name and key repr used in file names"""
+        return sha1(f"{self.name}:{key!r}".encode()).hexdigest()
+
+    @contextmanager
+    def lock(self, key: Hashable, timeout: float) -> Generator[None, None, None]:
+        """
+        Holds exclusive lock of key shared by all processes using cache
+        directory, so only one process computes value for key at a time. Lock
+        files are kept in "locks" subdirectory and are removed on
+        invalidation. Does nothing if cache is disabled.
+
+        :param key: cache key.
+        :param timeout: maximal number of seconds to wait for lock.
+        :return: generator for context manager.
+
+        """
+        if not self.directory:
+            yield
+            return None
+        locks = path.join(self.directory, "locks")
+        makedirs(locks, exist_ok=True)
+        with open(path.join(locks, f"{self.digest(key)}.lock"), "a") as file:
+            deadline = monotonic() + timeout
+            while True:
+                try:
+                    flock(file, LOCK_EX | LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if monotonic() > deadline:
+                        raise TimeoutError(f"Cache key is locked for {timeout} s")
+                    sleep(0.05)
+            try:
+                yield
+            finally:
+                flock(file, LOCK_UN)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns cached value for key.
+
+        :param key: cache key.
+        :return: cached value or None if it is not found or cache is disabled.
+
+        """
+        if not self.directory:
+            return None
+        try:
+            with open(self.key_path(key)) as file:
+                value = load(file)
+        except (FileNotFoundError, ValueError):
+            value = None
+        record_cache(self.name, value is not None)
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[str] = None) -> None:
+        """
+        Atomically saves JSON serializable value for key in cache. Value is
+        saved into generation in which its computation started, so value
+        computed from data before invalidation is never served after it.
+
+        :param key: cache key.
+        :param value: value to save.
+        :param generation: generation read before value computation started,
+        value is not saved if cache was invalidated since then.
+        :return: None.
+
+        """
+        if not self.directory:
+            return None
+        current = self.generation()
+        if generation is not None and generation != current:
+            return None
+        key_path = self.key_path(key, current)
+        makedirs(path.dirname(key_path), exist_ok=True)
+        with NamedTemporaryFile("w", dir=self.directory, delete=False) as file:
+            dump(value, file)
+        try:
+            replace(file.name, key_path)
+        except FileNotFoundError:
+            remove(file.name)
+
+    def invalidate(self) -> None:
+        """
+        Starts new generation for all caches in directory and removes
+        previous generations data. Values computed before invalidation and
+        saved with their start generation are dropped or saved into previous
+        generation which is never read.
+
+        :return: None.
+
+        """
+        if not self.directory:
+            return None
+        makedirs(self.directory, exist_ok=True)
+        generation = str(time_ns())
+        with NamedTemporaryFile("w", dir=self.directory, delete=False) as file:
+            file.write(generation)
+        replace(file.name, path.join(self.directory, "generation"))
+        for entry in scandir(self.directory):
+            if entry.name == "locks":
+                for lock_file in scandir(entry.path):
+                    remove(lock_file.path)
+            elif entry.is_dir() and entry.name != generation:
+                rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,111 @@
+"""
+City catalog stored in database "city" table and in-memory prefix index over
+it for city search and validation. Catalog is synchronized with cities.json
+config, so index page doesn't depend on the number of tracked cities.
+
+"""
+from bisect import bisect_left
+from functools import lru_cache
+from re import split
+from typing import Dict, List, Optional
+
+from data.cite_config import cities
+from data.db import Base, Session, WriterSession, writer_engine
+from data.models import City
+
+
+def normalize_name(name: str) -> str:
+    """Returns city name in lower case with words joined by "-", like in catalog"""
+    return "-".join(name.lower().split())
+
+
+class CityIndex:
+    """
+    Sorted list of search keys for binary search by prefix. Every city has
+    key for full name and keys for every word of name after "-" or space, so
+    "petersburg" finds "saint-petersburg".
+
+    :param codes: dict with city names and their URL codes.
+
+    """
+
+    def __init__(self, codes: Dict[str, str]) -> None:
+        self.codes = {normalize_name(name): code for name, code in codes.items()}
+        keys = set()
+        for name in codes:
+            words = split(r"[-\s]", name.lower())
+            keys.update(("-".join(words[i:]), name) for i in range(len(words)))
+        self.keys = sorted(keys)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def code(self, name: str) -> Optional[str]:
+        """Returns city URL code for city name in any case or None for unknown city"""
+        return self.codes.get(normalize_name(name))
+
+    def search(self, prefix: str, limit: int = 10) -> List[str]:
+        """Returns city names with full name or any name word starting with prefix.
+
+        :param prefix: beginning of city name or name word.
+        :param limit: maximal number of returned names.
+        :return: list with city names sorted by matched key.
+
+        """
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        names = {}
+        position = bisect_left(self.keys, (prefix, ""))
+        while position < len(self.keys) and len(names) < limit:
+            key, name = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            names[name] = None
+            position += 1
+        return list(names)
+
+
+def sync_catalog() -> int:
+    """
+    Adds cities from cities.json config which are missing in catalog table.
+    Cities are merged in writer transaction, so concurrently started
+    processes don't add the same city twice.
+
+    :return: number of added cities.
+
+    """
+    Base.metadata.create_all(writer_engine)
+    session = Session()
+    try:
+        known = {code for code, in session.query(City.code)}
+    finally:
+        session.close()
+    new = [City(code, name) for code, name in cities.items() if code not in known]
+    if new:
+        session = WriterSession()
+        try:
+            for city in new:
+                session.merge(city)
+            session.commit()
+        finally:
+            session.close()
+    return len(new)
+
+
+@lru_cache(maxsize=1)
+def city_index() -> CityIndex:
+    """
+    Returns prefix index over city catalog. Index is built once per process
+    after catalog synchronization.
+
+    :return: CityIndex instance.
+
+    """
+    sync_catalog()
+    session = Session()
+    try:
+        codes = {name: code for code, name in session.query(City.code, City.name)}
+    finally:
+        session.close()
+    return CityIndex(codes)
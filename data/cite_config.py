@@ -1,11 +1,40 @@
 """Different config data for application scripts"""
 from datetime import date
 from json import load
+from os import environ
 from typing import List
 
-url_main = "https://www.gismeteo.ru/diary"
+
+def env_flag(name: str) -> bool:
+    """Checks if boolean option is switched on in environment variables.
+
+    :param name: environment variable name.
+    :return: True if variable value is "1" or "true", False otherwise.
+
+    """
+    return environ.get(name, "").lower() in ("1", "true")
+
+
+url_main = environ.get("WEATHER_SOURCE_URL", "https://www.gismeteo.ru/diary")
 today = date.today()
 
+metrics_enabled = env_flag("METRICS_ENABLED")
+metrics_pushgateway = environ.get("METRICS_PUSHGATEWAY")
+profiling_enabled = env_flag("PROFILING_ENABLED")
+profiles_dir = environ.get("PROFILES_DIR", "/tmp/profiles")
+cache_dir = environ.get("CACHE_DIR")
+archive_build = environ.get("ARCHIVE_BUILD", "local")
+chunk_timeout = float(environ.get("ARCHIVE_CHUNK_TIMEOUT", 3600))
+stream_parse = env_flag("STREAM_PARSE")
+stats_backend = environ.get("STATS_BACKEND", "sqlite")
+coalesce_timeout = float(environ.get("COALESCE_TIMEOUT", 30))
+duckdb_path = environ.get("DUCKDB_PATH", "/db/statistic.duckdb")
+warm_periods = [
+    int(days) for days in environ.get("WARM_PERIODS", "7,30,365").split(",")
+]
+warm_top = int(environ.get("WARM_TOP", 20))
+access_log_days = int(environ.get("ACCESS_LOG_DAYS", 7))
+
 
 def load_agents() -> List[str]:
     """Loads data with different user-agents for web request from config file.
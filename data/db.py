@@ -1,9 +1,48 @@
 """Defines connection parameters and declarative base class for SQLAlchemy"""
-from sqlalchemy import engine
+from os import environ
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DB_PATH = "/db/statistic.db"
-engine = engine.create_engine(f"sqlite:///{DB_PATH}", echo=True)
+DB_PATH = environ.get("DB_PATH", "/db/statistic.db")
+BUSY_TIMEOUT = float(environ.get("DB_BUSY_TIMEOUT", 30))
+
+
+def set_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Switches database into WAL journal mode on connect, so readers don't block
+    writer and writer doesn't block readers. Disables pysqlite own transaction
+    handling, transactions are started by "begin" event listener instead.
+
+    """
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def sqlite_engine(begin: str) -> Engine:
+    """
+    Creates engine for database in WAL mode with busy timeout. Every session
+    transaction starts with provided BEGIN statement, so all reads within one
+    session see the same consistent database snapshot.
+
+    :param begin: statement to start transaction with.
+    :return: SQLAlchemy engine.
+
+    """
+    timeout = {"timeout": BUSY_TIMEOUT}
+    new_engine = create_engine(f"sqlite:///{DB_PATH}", echo=True, connect_args=timeout)
+    event.listen(new_engine, "connect", set_pragmas)
+    event.listen(new_engine, "begin", lambda conn: conn.exec_driver_sql(begin))
+    return new_engine
+
+
+engine = sqlite_engine("BEGIN")
+writer_engine = sqlite_engine("BEGIN IMMEDIATE")
 Session = sessionmaker(bind=engine)
+WriterSession = sessionmaker(bind=writer_engine)
 Base = declarative_base()
@@ -0,0 +1,205 @@
+"""
+Embedded DuckDB database that mirrors "statistic" table for analytical
+queries (data.duck_stats.DuckStats). Mirror is kept in sync from
+Stat.add_commit if STATS_BACKEND=duckdb. Locked mirror sync is retried, if it
+still fails, mirror is marked stale and statistics are loaded from SQLite
+until mirror is rebuilt by daily update task or with:
+
+    python -m data.duck_db
+
+"""
+from contextlib import contextmanager
+from csv import writer as csv_writer
+from logging import getLogger
+from os import path, remove
+from tempfile import NamedTemporaryFile
+from time import monotonic, sleep
+from typing import Generator, Iterable, Optional, Tuple
+
+import duckdb
+from sqlalchemy.engine import Engine
+
+from data.cite_config import duckdb_path
+from data.db import BUSY_TIMEOUT
+from data.soup_parser import leading_number
+
+SYNC_ATTEMPTS = 3
+logger = getLogger(__name__)
+database_path = duckdb_path
+schema = """
+CREATE TABLE IF NOT EXISTS statistic (
+    city VARCHAR NOT NULL,
+    day DATE NOT NULL,
+    max_temp INTEGER,
+    min_temp INTEGER,
+    avg_temp DOUBLE,
+    weather VARCHAR,
+    w_direction VARCHAR,
+    w_speed DOUBLE
+)
+"""
+columns = ["city", "day", "max_temp", "min_temp", "avg_temp"]
+columns += ["weather", "w_direction", "w_speed"]
+
+
+def number(value: Optional[str]) -> Optional[float]:
+    """
+    Converts text value to number the same way as SQLite does: by leading
+    numeric part of text, 0 for non-numeric text and None for None.
+
+    :param value: text value from parsed weather data, e.g. "+5" or "3m/s".
+    :return: numeric value.
+
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    number = leading_number(value)
+    return 0.0 if number is None else number
+
+
+def mirror_row(row: Tuple) -> Tuple:
+    """Converts "statistic" table row values into DuckDB mirror row.
+
+    :param row: tuple with values in "columns" order.
+    :return: tuple with numeric temperatures and wind speed.
+
+    """
+    city, day, max_temp, min_temp, avg_temp, weather, w_direction, w_speed = row
+    max_temp, min_temp = number(max_temp), number(min_temp)
+    return (
+        city,
+        day,
+        None if max_temp is None else int(max_temp),
+        None if min_temp is None else int(min_temp),
+        number(avg_temp),
+        weather,
+        w_direction,
+        number(w_speed),
+    )
+
+
+def stale_marker() -> str:
+    """Returns path of file which marks mirror as out of sync with SQLite"""
+    return f"{database_path}.stale"
+
+
+def is_stale() -> bool:
+    """Checks if mirror doesn't exist or is out of sync with SQLite database"""
+    return not path.isfile(database_path) or path.isfile(stale_marker())
+
+
+@contextmanager
+def duck_connection(
+    read_only: bool = True,
+) -> Generator[duckdb.DuckDBPyConnection, None, None]:
+    """
+    Opens connection to mirror database. Only one process can open database
+    for writing, so write connection waits for other connections up to
+    DB_BUSY_TIMEOUT seconds.
+
+    :param read_only: open database in read only mode.
+    :return: generator that yields DuckDB connection.
+
+    """
+    deadline = monotonic() + BUSY_TIMEOUT
+    while True:
+        try:
+            connection = duckdb.connect(database_path, read_only=read_only)
+            break
+        except duckdb.IOException:
+            if read_only or monotonic() > deadline:
+                raise
+            sleep(0.05)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def copy_rows(connection: duckdb.DuckDBPyConnection, rows: Iterable[Tuple]) -> None:
+    """Bulk loads rows into mirror table via temporary CSV file.
+
+    :param connection: DuckDB connection opened for writing.
+    :param rows: iterable with "statistic" table rows in "columns" order.
+    :return: None.
+
+    """
+    with NamedTemporaryFile("w", suffix=".csv", newline="", delete=False) as file:
+        csv_writer(file).writerows(mirror_row(row) for row in rows)
+    try:
+        connection.execute(f"COPY statistic FROM '{file.name}' (HEADER false)")
+    finally:
+        remove(file.name)
+
+
+def mirror_rows(rows: Iterable) -> None:
+    """
+    Appends committed Stat instances into mirror. Sync of locked mirror is
+    retried SYNC_ATTEMPTS times, then mirror is marked as stale instead of
+    raising error, because rows are already saved in SQLite.
+
+    :param rows: iterable with Stat instances.
+    :return: None.
+
+    """
+    if is_stale():
+        return None
+    values = [tuple(getattr(row, column) for column in columns) for row in rows]
+    for attempt in range(1, SYNC_ATTEMPTS + 1):
+        try:
+            with duck_connection(read_only=False) as connection:
+                copy_rows(connection, values)
+            return None
+        except duckdb.IOException:
+            logger.warning("DuckDB mirror is locked, sync attempt %s failed", attempt)
+        except Exception:
+            logger.exception("DuckDB mirror sync failed")
+            break
+    logger.error("DuckDB mirror is marked stale, reports are computed in SQLite")
+    open(stale_marker(), "w").close()
+
+
+def rebuild_mirror(engine: Engine) -> int:
+    """
+    Creates mirror from scratch with all rows from SQLite database. Should be
+    run while there is no data ingest.
+
+    :param engine: SQLAlchemy engine for SQLite database.
+    :return: number of rows in mirror.
+
+    """
+    with duck_connection(read_only=False) as connection:
+        connection.execute("DROP TABLE IF EXISTS statistic")
+        connection.execute(schema)
+        with engine.connect() as sqlite:
+            select = f"SELECT {', '.join(columns)} FROM statistic"
+            copy_rows(connection, sqlite.exec_driver_sql(select))
+        count = connection.execute("SELECT count(*) FROM statistic").fetchone()[0]
+    if path.isfile(stale_marker()):
+        remove(stale_marker())
+    return count
+
+
+def refresh_mirror(engine: Engine) -> bool:
+    """
+    Rebuilds mirror if it is stale. Errors are only logged, so mirror is
+    rebuilt on next call.
+
+    :param engine: SQLAlchemy engine for SQLite database.
+    :return: True if mirror is in sync with SQLite database.
+
+    """
+    if not is_stale():
+        return True
+    try:
+        logger.info("Rows in rebuilt DuckDB mirror: %s", rebuild_mirror(engine))
+    except Exception:
+        logger.exception("DuckDB mirror rebuild failed")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    from data.db import engine
+
+    print(f"Rows in DuckDB mirror: {rebuild_mirror(engine)}")
@@ -0,0 +1,182 @@
+"""
+GetStats implementation on embedded DuckDB mirror of "statistic" table
+(data.duck_db). Selected with STATS_BACKEND=duckdb environment variable.
+Falls back to SQLite GetStats if mirror is stale or locked by writer.
+
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+
+from data.duck_db import duck_connection, is_stale
+from data.fetch_db import GetStats, last_day
+from data.metrics import duckdb_fallbacks, increase, stats_seconds, timed
+
+RANGE = "city = ? AND day BETWEEN ? AND ?"
+
+
+class DuckStats(GetStats):
+    """
+    Class with the same API as GetStats which runs vectorized analytical
+    queries on DuckDB. All queries of one report use one read only
+    connection.
+
+    """
+
+    def __init__(self) -> None:
+        self.connection: Optional[duckdb.DuckDBPyConnection] = None
+
+    def query(self, sql: str, *params) -> List[Tuple]:
+        """Runs query on current report connection or on new connection.
+
+        :param sql: SQL query with "?" placeholders.
+        :param params: query parameters.
+        :return: list with result rows.
+
+        """
+        if self.connection is not None:
+            return self.connection.execute(sql, params).fetchall()
+        with duck_connection() as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def compute_report(self, key: Tuple[str, ...]) -> Dict:
+        """
+        Computes report statistics from DuckDB mirror or from SQLite if mirror
+        can't be used now. Called after cache miss while report lock is held,
+        so mirror connection is not opened for cached reports.
+
+        :param key: report cache key with class name, city, begin and end.
+        :return: dict with all weather statistics parameters.
+
+        """
+        _, city, begin, end = key
+        if is_stale():
+            increase(duckdb_fallbacks, "stale")
+            return GetStats().get_report(city, begin, end)
+        try:
+            with duck_connection() as self.connection:
+                return super().compute_report(key)
+        except duckdb.IOException:
+            increase(duckdb_fallbacks, "locked")
+            return GetStats().get_report(city, begin, end)
+        finally:
+            self.connection = None
+
+    @timed(stats_seconds, "duckdb_get_min_temp")
+    def get_min_temp(self, city: str, begin: str, end: str) -> int:
+        """Returns absolute minimum temperature for city and time period"""
+        return self.query(
+            f"SELECT min(min_temp) FROM statistic WHERE {RANGE}", city, begin, end
+        )[0][0]
+
+    @timed(stats_seconds, "duckdb_get_max_temp")
+    def get_max_temp(self, city: str, begin: str, end: str) -> int:
+        """Returns absolute maximum temperature for city and time period"""
+        return self.query(
+            f"SELECT max(max_temp) FROM statistic WHERE {RANGE}", city, begin, end
+        )[0][0]
+
+    @timed(stats_seconds, "duckdb_get_avg_temp")
+    def get_avg_temp(self, city: str, begin: str, end: str) -> float:
+        """Returns average temperature for city and time period"""
+        rows = self.query(
+            f"SELECT avg(avg_temp) FROM statistic WHERE {RANGE}", city, begin, end
+        )
+        return round(rows[0][0], 2)
+
+    @timed(stats_seconds, "duckdb_get_wind_speed")
+    def get_wind_speed(self, city: str, begin: str, end: str) -> float:
+        """Returns average wind speed for city and time period"""
+        rows = self.query(
+            f"SELECT avg(w_speed) FROM statistic WHERE {RANGE}", city, begin, end
+        )
+        return round(rows[0][0], 2)
+
+    @timed(stats_seconds, "duckdb_get_wind_dir")
+    def get_wind_dir(self, city: str, begin: str, end: str) -> str:
+        """Returns most common wind direction for city and time period"""
+        sql = f"""
+            SELECT w_direction FROM statistic WHERE {RANGE}
+            GROUP BY w_direction ORDER BY count(w_direction) DESC, w_direction
+            LIMIT 1
+        """
+        return self.query(sql, city, begin, end)[0][0]
+
+    @timed(stats_seconds, "duckdb_get_date_temp")
+    def get_date_temp(self, city: str, begin: str, end: str) -> List[str]:
+        """
+        Returns two dates for city and time period in which average temperature
+        was closest to last date temperature.
+
+        """
+        today_t = self.query(
+            "SELECT avg_temp FROM statistic WHERE city = ? AND day = ? LIMIT 1",
+            city,
+            last_day,
+        )
+        if not today_t:
+            raise LookupError(f"No weather data for {city} on {last_day}")
+        sql = f"""
+            SELECT day FROM statistic WHERE {RANGE}
+            ORDER BY abs(avg_temp - ?), day LIMIT 2
+        """
+        rows = self.query(sql, city, begin, end, today_t[0][0])
+        return [datetime.strftime(row[0], "%d.%m.%Y") for row in rows]
+
+    @timed(stats_seconds, "duckdb_precipitations")
+    def precipitations(self, city: str, begin: str, end: str) -> float:
+        """Returns percentage of days with any precipitations for time period"""
+        day_from = datetime.strptime(begin, "%Y-%m-%d")
+        day_until = datetime.strptime(end, "%Y-%m-%d")
+        days = (day_until - day_from).days + 1
+        sql = f"SELECT count(weather) FROM statistic WHERE {RANGE}"
+        count = self.query(sql, city, begin, end)[0][0]
+        return round(count / days * 100, 2)
+
+    @timed(stats_seconds, "duckdb_common_weather")
+    def common_weather(self, city: str, begin: str, end: str) -> List[str]:
+        """Returns list with two most common precipitations for time period"""
+        sql = f"""
+            SELECT weather FROM statistic WHERE {RANGE}
+            GROUP BY weather ORDER BY count(weather) DESC, weather LIMIT 2
+        """
+        return [row[0] for row in self.query(sql, city, begin, end) if row[0]]
+
+    def years_avg(
+        self, column: str, city: str, begin: str, end: str
+    ) -> Optional[List[Tuple[int, float]]]:
+        """
+        If provided time period is 2 years and more - returns list with city's
+        average values of column per years except last year, in one query.
+
+        :param column: "max_temp" or "min_temp" column name.
+        :param city: city to gather data for.
+        :param begin: date from which gather statistics.
+        :param end: date until which gather statistics.
+        :return: list with years and appropriate average values.
+
+        """
+        first_year, last_year = int(begin[:4]), int(end[:4])
+        if last_year - first_year < 2:
+            return None
+        sql = f"""
+            SELECT year(day) AS year, round(avg({column}), 2) FROM statistic
+            WHERE {RANGE} GROUP BY year ORDER BY year
+        """
+        start, stop = f"{first_year}-01-01", f"{last_year - 1}-12-31"
+        return [tuple(row) for row in self.query(sql, city, start, stop)]
+
+    @timed(stats_seconds, "duckdb_get_years_max")
+    def get_years_max(
+        self, city: str, begin: str, end: str
+    ) -> Optional[List[Tuple[int, float]]]:
+        """Returns average maximum temperatures per years for long periods"""
+        return self.years_avg("max_temp", city, begin, end)
+
+    @timed(stats_seconds, "duckdb_get_years_min")
+    def get_years_min(
+        self, city: str, begin: str, end: str
+    ) -> Optional[List[Tuple[int, float]]]:
+        """Returns average minimum temperatures per years for long periods"""
+        return self.years_avg("min_temp", city, begin, end)
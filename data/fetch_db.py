@@ -3,20 +3,36 @@ Defines class that provides API for fetching data from database for user request
 in Flask app.
 
 """
+from collections import defaultdict
 from contextlib import contextmanager
-from datetime import datetime, timedelta
-from typing import Generator, List, Optional, Tuple
-
-from sqlalchemy import desc, func
-
-from data.cite_config import today
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, desc, func, literal, select, union_all
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.expression import ColumnElement, Subquery
+
+from data.cache import SharedCache
+from data.cite_config import cache_dir, coalesce_timeout, stats_backend, today
+from data.histograms import distribution, percentile, period_histograms
+from data.metrics import coalesced_requests, increase, stats_seconds, timed
 from data.models import Session, Stat
+from data.singleflight import SingleFlight
 
 last_day = today - timedelta(days=1)
+stats_cache = SharedCache(cache_dir, "stats")
+report_flights = SingleFlight(coalesce_timeout)
+snapshot_session: ContextVar[Optional[Session]] = ContextVar("snapshot", default=None)
 
 
 @contextmanager
 def session_manager() -> Generator[Session, None, None]:
+    current_session = snapshot_session.get()
+    if current_session is not None:
+        yield current_session
+        return None
     session = Session()
     try:
         yield session
@@ -24,6 +40,24 @@ def session_manager() -> Generator[Session, None, None]:
         session.close()
 
 
+@contextmanager
+def snapshot() -> Generator[Session, None, None]:
+    """
+    Context manager to run all GetStats queries inside block in one session
+    and read transaction, so in WAL mode they see the same database snapshot
+    even if new rows are written concurrently.
+
+    :return: generator that yields SQLAlchemy Session instance.
+
+    """
+    with session_manager() as session:
+        token = snapshot_session.set(session)
+        try:
+            yield session
+        finally:
+            snapshot_session.reset(token)
+
+
 class GetStats:
     """
     Class that provides facade API for Flask app to load data from database
@@ -32,6 +66,70 @@ class GetStats:
 
     """
 
+    def get_report(self, city: str, begin: str, end: str) -> Dict:
+        """
+        Returns all weather statistics for report page for provided city and
+        time period. All queries run in one database snapshot. Result is saved
+        in cache shared by all processes until cache is invalidated after new
+        data ingest. Concurrent requests for the same report wait for one
+        computation: threads of process share its result, other processes
+        wait for cache key lock and read result from cache.
+
+        :param city: city to gather statistics for.
+        :param begin: date from which gather statistics.
+        :param end: date until which gather statistics.
+        :return: dict with all weather statistics parameters.
+
+        """
+        key = (type(self).__name__, city, str(begin), str(end))
+        params = stats_cache.get(key)
+        if params is not None:
+            return params
+        return report_flights.do(key, partial(self.locked_report, key))
+
+    def locked_report(self, key: Tuple[str, ...]) -> Dict:
+        """
+        Computes report while holding cache key lock shared by all processes,
+        or returns report saved in cache by process that held lock before.
+
+        :param key: report cache key with class name, city, begin and end.
+        :return: dict with all weather statistics parameters.
+
+        """
+        with stats_cache.lock(key, coalesce_timeout):
+            params = stats_cache.get(key)
+            if params is not None:
+                increase(coalesced_requests, "shared")
+                return params
+            return self.compute_report(key)
+
+    def compute_report(self, key: Tuple[str, ...]) -> Dict:
+        """Computes report statistics in one snapshot and saves them in cache.
+
+        :param key: report cache key with class name, city, begin and end.
+        :return: dict with all weather statistics parameters.
+
+        """
+        _, city, begin, end = key
+        generation = stats_cache.generation()
+        with snapshot():
+            params = {
+                "max_temp": self.get_max_temp(city, begin, end),
+                "min_temp": self.get_min_temp(city, begin, end),
+                "avg_temp": self.get_avg_temp(city, begin, end),
+                "wind_speed": self.get_wind_speed(city, begin, end),
+                "wind_dir": self.get_wind_dir(city, begin, end),
+                "date_temp": self.get_date_temp(city, begin, end),
+                "precipitations": self.precipitations(city, begin, end),
+                "common_weather": self.common_weather(city, begin, end),
+                "years_max": self.get_years_max(city, begin, end),
+                "years_min": self.get_years_min(city, begin, end),
+                "distribution": self.get_distribution(city, begin, end),
+            }
+        stats_cache.set(key, params, generation)
+        return params
+
+    @timed(stats_seconds, "get_min_temp")
     def get_min_temp(self, city: str, begin: str, end: str) -> int:
         """
         Make query to database and returns absolute minimum temperature for
@@ -51,6 +149,7 @@ class GetStats:
             )
         return min_temp
 
+    @timed(stats_seconds, "get_max_temp")
     def get_max_temp(self, city: str, begin: str, end: str) -> int:
         """
         Make query to database and returns absolute maximum temperature for
@@ -70,6 +169,7 @@ class GetStats:
             )
         return max_temp
 
+    @timed(stats_seconds, "get_avg_temp")
     def get_avg_temp(self, city: str, begin: str, end: str) -> float:
         """
         Make query to database and returns average temperature for provided
@@ -89,6 +189,7 @@ class GetStats:
             )
         return round(avg_temp, 2)
 
+    @timed(stats_seconds, "get_wind_speed")
     def get_wind_speed(self, city: str, begin: str, end: str) -> float:
         """
         Make query to database and returns average wind speed for provided
@@ -108,6 +209,7 @@ class GetStats:
             )
         return round(wind_speed, 2)
 
+    @timed(stats_seconds, "get_wind_dir")
     def get_wind_dir(self, city: str, begin: str, end: str) -> str:
         """
         Make query to database and returns average wind direction for provided
@@ -131,6 +233,7 @@ class GetStats:
             )
         return wind_dir
 
+    @timed(stats_seconds, "get_date_temp")
     def get_date_temp(self, city: str, begin: str, end: str) -> List[str]:
         """
         Make query to database and returns list with dates for provided
@@ -160,6 +263,7 @@ class GetStats:
             dates = sorted(days, key=lambda x: x[0])
         return [datetime.strftime(day[1], "%d.%m.%Y") for day in dates][:2]
 
+    @timed(stats_seconds, "precipitations")
     def precipitations(self, city: str, begin: str, end: str) -> float:
         """
         Make query to database and returns percentage of days with any
@@ -171,10 +275,7 @@ class GetStats:
         :return: percentage value of days with any precipitations.
 
         """
-        day_from = datetime.strptime(begin, "%Y-%m-%d")
-        day_until = datetime.strptime(end, "%Y-%m-%d")
-        period = day_until - day_from
-        days = period.days + 1
+        days = period_days(begin, end)
         with session_manager() as session:
             precipitations_count = (
                 session.query(func.count(Stat.weather))
@@ -184,6 +285,7 @@ class GetStats:
         percentage = precipitations_count / days * 100
         return round(percentage, 2)
 
+    @timed(stats_seconds, "common_weather")
     def common_weather(self, city: str, begin: str, end: str) -> List[str]:
         """
         Make query to database and returns list with most common precipitations
@@ -206,6 +308,7 @@ class GetStats:
             )
         return [weather[0] for weather in weathers if weather[0]]
 
+    @timed(stats_seconds, "get_years_max")
     def get_years_max(
         self, city: str, begin: str, end: str
     ) -> Optional[List[Tuple[int, float]]]:
@@ -225,18 +328,18 @@ class GetStats:
             return None
         years = range(first_year, last_year)
         year_temps = []
-        session = Session()
-        for year in years:
-            start, stop = f"{year}-01-01", f"{year}-12-31"
-            year_max_temp = (
-                session.query(func.avg(Stat.max_temp))
-                .filter(Stat.city == city, Stat.day.between(start, stop))
-                .first()[0]
-            )
-            year_temps.append((year, round(year_max_temp, 2)))
-        session.close()
+        with session_manager() as session:
+            for year in years:
+                start, stop = f"{year}-01-01", f"{year}-12-31"
+                year_max_temp = (
+                    session.query(func.avg(Stat.max_temp))
+                    .filter(Stat.city == city, Stat.day.between(start, stop))
+                    .first()[0]
+                )
+                year_temps.append((year, round(year_max_temp, 2)))
         return year_temps
 
+    @timed(stats_seconds, "get_years_min")
     def get_years_min(
         self, city: str, begin: str, end: str
     ) -> Optional[List[Tuple[int, float]]]:
@@ -256,14 +359,163 @@ class GetStats:
             return None
         years = range(first_year, last_year)
         year_temps = []
-        session = Session()
-        for year in years:
-            start, stop = f"{year}-01-01", f"{year}-12-31"
-            year_min_temp = (
-                session.query(func.avg(Stat.min_temp))
-                .filter(Stat.city == city, Stat.day.between(start, stop))
-                .first()[0]
-            )
-            year_temps.append((year, round(year_min_temp, 2)))
-        session.close()
+        with session_manager() as session:
+            for year in years:
+                start, stop = f"{year}-01-01", f"{year}-12-31"
+                year_min_temp = (
+                    session.query(func.avg(Stat.min_temp))
+                    .filter(Stat.city == city, Stat.day.between(start, stop))
+                    .first()[0]
+                )
+                year_temps.append((year, round(year_min_temp, 2)))
         return year_temps
+
+    @timed(stats_seconds, "get_distribution")
+    def get_distribution(self, city: str, begin: str, end: str) -> Dict:
+        """
+        Returns percentiles of daily maximum and minimum temperatures and wind
+        speed and wind speed distribution for provided city and time period.
+        Computed from merged month histograms, see data.histograms.
+
+        :param city: city to gather statistics for.
+        :param begin: date from which gather statistics.
+        :param end: date until which gather statistics.
+        :return: dict with p10, p50 and p90 percentiles for every parameter
+        and list with wind speeds and percentages of days.
+
+        """
+        with session_manager() as session:
+            histograms = period_histograms(session, city, begin, end)
+        result = {
+            metric: {f"p{p}": percentile(histogram, p) for p in (10, 50, 90)}
+            for metric, histogram in histograms.items()
+        }
+        result["wind_distribution"] = distribution(histograms["wind_speed"])
+        return result
+
+    @timed(stats_seconds, "get_periods")
+    def get_periods(self, city: str, periods: List[Tuple[str, str]]) -> List[Dict]:
+        """
+        Returns weather statistics for every provided period of city for
+        comparison of periods, e.g. the same month of different years. All
+        periods are computed together in three grouped queries: aggregates,
+        wind directions and precipitations counts per period.
+
+        :param city: city to gather statistics for.
+        :param periods: list with (begin, end) dates strings.
+        :return: list with dicts of statistics parameters for every period,
+        parameters are None for periods without data.
+
+        """
+        bounds = union_all(
+            *(
+                select(
+                    literal(index).label("period"),
+                    literal(parse_day(begin)).label("begin"),
+                    literal(parse_day(end)).label("end"),
+                )
+                for index, (begin, end) in enumerate(periods)
+            )
+        ).subquery()
+        with session_manager() as session:
+            aggregates = per_period(
+                session,
+                bounds,
+                city,
+                func.max(Stat.max_temp),
+                func.min(Stat.min_temp),
+                func.avg(Stat.avg_temp),
+                func.avg(Stat.w_speed),
+                func.count(Stat.weather),
+            ).all()
+            directions = per_period(
+                session, bounds, city, Stat.w_direction, func.count(Stat.w_direction)
+            ).group_by(Stat.w_direction)
+            weathers = per_period(
+                session, bounds, city, Stat.weather, func.count(Stat.weather)
+            ).group_by(Stat.weather)
+            wind_dirs, common_weathers = most_common(directions), most_common(weathers)
+        results = [
+            dict(dict.fromkeys(period_params), **{"from": begin, "until": end})
+            for begin, end in periods
+        ]
+        for index, max_temp, min_temp, avg_temp, wind_speed, weather in aggregates:
+            days = period_days(*periods[index])
+            results[index].update(
+                max_temp=max_temp,
+                min_temp=min_temp,
+                avg_temp=round(avg_temp, 2),
+                wind_speed=round(wind_speed, 2),
+                wind_dir=wind_dirs[index][0],
+                precipitations=round(weather / days * 100, 2),
+                common_weather=[value for value in common_weathers[index][:2] if value],
+            )
+        return results
+
+
+period_params = (
+    "max_temp",
+    "min_temp",
+    "avg_temp",
+    "wind_speed",
+    "wind_dir",
+    "precipitations",
+    "common_weather",
+)
+
+
+def per_period(
+    session: Session, bounds: Subquery, city: str, *columns: ColumnElement
+) -> Query:
+    """
+    Returns query of provided columns grouped by period for city rows joined
+    with periods bounds subquery.
+
+    :param session: SQLAlchemy session.
+    :param bounds: subquery with "period" index, "begin" and "end" columns.
+    :param city: city to gather statistics for.
+    :param columns: columns or aggregate functions to select for period.
+    :return: SQLAlchemy Query.
+
+    """
+    in_period = and_(Stat.city == city, Stat.day.between(bounds.c.begin, bounds.c.end))
+    query = session.query(bounds.c.period, *columns).select_from(bounds)
+    return query.join(Stat, in_period).group_by(bounds.c.period)
+
+
+def most_common(counts: Iterable[Tuple[int, str, int]]) -> Dict[int, List[str]]:
+    """Returns values of every period sorted from the most common.
+
+    :param counts: iterable with (period, value, count) rows.
+    :return: dict with periods indexes and lists of values.
+
+    """
+    values = defaultdict(list)
+    for period, value, _ in sorted(counts, key=lambda row: -row[2]):
+        values[period].append(value)
+    return values
+
+
+def parse_day(day: str) -> date:
+    """Returns date from "YYYY-MM-DD" string"""
+    return datetime.strptime(day, "%Y-%m-%d").date()
+
+
+def period_days(begin: str, end: str) -> int:
+    """Returns number of days in period including both ends"""
+    return (parse_day(end) - parse_day(begin)).days + 1
+
+
+def create_stats() -> GetStats:
+    """
+    Returns statistics API instance for backend configured with STATS_BACKEND
+    environment variable: "sqlite" (default) or "duckdb".
+
+    :return: GetStats or DuckStats instance.
+
+    """
+    if stats_backend == "duckdb":
+        from data.duck_stats import DuckStats
+
+        return DuckStats()
+    return GetStats()
@@ -1,21 +1,31 @@
 """Defines form for gather data from user on index page of website"""
 from flask_wtf import FlaskForm
-from wtforms import SelectField
-from wtforms.validators import DataRequired
+from wtforms import Field, StringField
+from wtforms.validators import DataRequired, ValidationError
 
-from data.cite_config import cities
+from data.catalog import city_index, normalize_name
 
-city_list = [cities for cities in cities.values()]
+
+def known_city(form: FlaskForm, field: Field) -> None:
+    """
+    Validates that city name exists in city catalog by index lookup and
+    replaces entered name with catalog name, e.g. "Saint Petersburg" with
+    "saint-petersburg".
+
+    """
+    name = normalize_name(field.data)
+    if city_index().code(name) is None:
+        raise ValidationError("Unknown city")
+    field.data = name
 
 
 class WeatherForm(FlaskForm):
-    """Website form with list of cities.
+    """Website form with city name input validated by city catalog.
 
     Also allows to add hidden_tag for web page to avoid CSRF"""
 
-    city = SelectField(
+    city = StringField(
         "Select city:",
-        choices=city_list,
-        default=cities["4079"],
-        validators=[DataRequired()],
+        default="saint-petersburg",
+        validators=[DataRequired(), known_city],
     )
@@ -0,0 +1,255 @@
+"""
+Mergeable fixed-bin histograms of daily maximum and minimum temperatures and
+wind speed per city and month. Histograms are updated in the same transaction
+as ingested rows, so percentiles and distributions for any period are computed
+by merging histograms of full months and counting days of partial months at
+period edges, without reading all period rows. Complete rebuild of
+histograms saves built marker row, so histograms are rebuilt from scratch
+only if database has rows saved before histograms were added.
+
+Bins have fixed BIN_WIDTH width (1 ℃ or 1 m/s) and are identified by lower
+bound, so percentile error is less than BIN_WIDTH. Source website provides
+integer values, so with BIN_WIDTH = 1 percentiles are exact. Histograms for
+database created before are built on server start or with:
+
+    python -m data.histograms
+
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from json import dumps, loads
+from math import ceil, floor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from data.models import MonthHistogram, Stat
+from data.soup_parser import leading_number
+
+BIN_WIDTH = 1
+histogram_metrics = ("max_temp", "min_temp", "wind_speed")
+Key = Tuple[str, date, str]
+BUILT_MARKER: Key = ("", date(1970, 1, 1), "built")
+
+
+def value_bin(value) -> Optional[int]:
+    """
+    Returns histogram bin lower bound for value from database or parsed from
+    website text, e.g. 5, "+5" or "3m/s". Returns None for missing values.
+
+    :param value: weather parameter value.
+    :return: bin lower bound.
+
+    """
+    if isinstance(value, str):
+        value = leading_number(value)
+    if value is None:
+        return None
+    return floor(value / BIN_WIDTH) * BIN_WIDTH
+
+
+def month_start(day: date) -> date:
+    """Returns first day of month for provided date"""
+    return day.replace(day=1)
+
+
+def load_counts(counts: str) -> Counter:
+    """Returns bins counter from saved JSON histogram counts"""
+    return Counter({int(bin_start): n for bin_start, n in loads(counts).items()})
+
+
+def count_rows(rows: Iterable[Tuple]) -> Dict[Key, Counter]:
+    """Counts rows values into month histograms.
+
+    :param rows: iterable with (city, day, max_temp, min_temp, w_speed) tuples.
+    :return: dict with (city, month, metric) keys and bins counters.
+
+    """
+    counts = defaultdict(Counter)
+    for city, day, *values in rows:
+        for metric, value in zip(histogram_metrics, values):
+            bin_start = value_bin(value)
+            if bin_start is not None:
+                counts[(city, month_start(day), metric)][bin_start] += 1
+    return counts
+
+
+def save_counts(session: Session, counts: Dict[Key, Counter], add: bool) -> None:
+    """
+    Adds counts to saved month histograms or replaces them. Doesn't commit,
+    so histograms are saved in the same transaction as rows.
+
+    :param session: SQLAlchemy writer session.
+    :param counts: dict with (city, month, metric) keys and bins counters.
+    :param add: add counts to existing histograms instead of replacing.
+    :return: None.
+
+    """
+    for (city, month, metric), counter in counts.items():
+        if add:
+            saved = session.get(MonthHistogram, (city, month, metric))
+            if saved is not None:
+                counter = counter + load_counts(saved.counts)
+        session.merge(MonthHistogram(city, month, metric, dumps(counter)))
+
+
+def add_rows(session: Session, rows: Iterable[Stat]) -> None:
+    """Adds new Stat rows into month histograms in current transaction.
+
+    :param session: SQLAlchemy writer session.
+    :param rows: iterable with new Stat instances.
+    :return: None.
+
+    """
+    values = ((r.city, r.day, r.max_temp, r.min_temp, r.w_speed) for r in rows)
+    save_counts(session, count_rows(values), add=True)
+
+
+def replace_year(session: Session, city: str, year: int, rows: List[Tuple]) -> None:
+    """
+    Replaces city month histograms for provided year with histograms of rows,
+    used when archive chunk rows replace city year data.
+
+    :param session: SQLAlchemy writer session.
+    :param city: city name.
+    :param year: year of rows.
+    :param rows: list with Stat arguments tuples.
+    :return: None.
+
+    """
+    session.query(MonthHistogram).filter(
+        MonthHistogram.city == city,
+        MonthHistogram.month.between(date(year, 1, 1), date(year, 12, 1)),
+    ).delete(synchronize_session=False)
+    values = ((row[0], row[1], row[2], row[3], row[6]) for row in rows)
+    save_counts(session, count_rows(values), add=False)
+
+
+def period_histograms(
+    session: Session, city: str, begin: str, end: str
+) -> Dict[str, Counter]:
+    """
+    Returns histograms for city and time period merged from month histograms
+    of months fully inside period and from rows of partial months at period
+    edges. Makes at most two queries.
+
+    :param session: SQLAlchemy session.
+    :param city: city to gather histograms for.
+    :param begin: date from which gather histograms.
+    :param end: date until which gather histograms.
+    :return: dict with metrics names and bins counters.
+
+    """
+    day_from, day_until = date.fromisoformat(begin), date.fromisoformat(end)
+    first_month = day_from
+    if day_from.day > 1:
+        first_month = month_start(day_from.replace(day=28) + timedelta(days=4))
+    after_last = month_start(day_until + timedelta(days=1))
+    histograms = {metric: Counter() for metric in histogram_metrics}
+    if first_month < after_last:
+        months = session.query(MonthHistogram).filter(
+            MonthHistogram.city == city,
+            MonthHistogram.month >= first_month,
+            MonthHistogram.month < after_last,
+        )
+        for month in months:
+            histograms[month.metric].update(load_counts(month.counts))
+    edges = (
+        session.query(Stat.city, Stat.day, Stat.max_temp, Stat.min_temp, Stat.w_speed)
+        .filter(Stat.city == city, Stat.day.between(day_from, day_until))
+        .filter((Stat.day < first_month) | (Stat.day >= after_last))
+    )
+    for (_, _, metric), counter in count_rows(edges).items():
+        histograms[metric].update(counter)
+    return histograms
+
+
+def percentile(histogram: Counter, percent: float) -> Optional[int]:
+    """Returns nearest-rank percentile bin of histogram.
+
+    :param histogram: bins counter.
+    :param percent: percentile from 0 to 100.
+    :return: lower bound of percentile bin, None for empty histogram.
+
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank, seen = max(ceil(percent / 100 * total), 1), 0
+    for bin_start in sorted(histogram):
+        seen += histogram[bin_start]
+        if seen >= rank:
+            return bin_start
+
+
+def distribution(histogram: Counter) -> List[Tuple[int, float]]:
+    """Returns histogram bins with percentage of days in every bin.
+
+    :param histogram: bins counter.
+    :return: list with bins lower bounds and percentages.
+
+    """
+    total = sum(histogram.values())
+    return [(b, round(histogram[b] / total * 100, 2)) for b in sorted(histogram)]
+
+
+def rebuild_histograms(engine: Engine) -> int:
+    """
+    Creates all month histograms from scratch from "statistic" table rows and
+    saves built marker.
+
+    :param engine: SQLAlchemy engine for database.
+    :return: number of saved month histograms.
+
+    """
+    MonthHistogram.__table__.create(engine, checkfirst=True)
+    session = Session(bind=engine)
+    try:
+        rows = session.query(
+            Stat.city, Stat.day, Stat.max_temp, Stat.min_temp, Stat.w_speed
+        )
+        counts = count_rows(rows)
+        session.query(MonthHistogram).delete()
+        save_counts(session, counts, add=False)
+        session.add(MonthHistogram(*BUILT_MARKER, "{}"))
+        session.commit()
+    finally:
+        session.close()
+    return len(counts)
+
+
+def is_built(engine: Engine) -> bool:
+    """
+    Checks if histograms were rebuilt from all rows. Histogram table itself can
+    be created empty by create_all before rows are added into histograms.
+
+    :param engine: SQLAlchemy engine for database.
+    :return: True if built marker is saved.
+
+    """
+    if not inspect(engine).has_table(MonthHistogram.__tablename__):
+        return False
+    session = Session(bind=engine)
+    try:
+        return session.get(MonthHistogram, BUILT_MARKER) is not None
+    finally:
+        session.close()
+
+
+def ensure_histograms(engine: Engine) -> None:
+    """Builds month histograms for database created before histograms were added.
+
+    :param engine: SQLAlchemy engine for database.
+    :return: None.
+
+    """
+    if not is_built(engine):
+        rebuild_histograms(engine)
+
+
+if __name__ == "__main__":
+    from data.db import writer_engine
+
+    print(f"Saved month histograms: {rebuild_histograms(writer_engine)}")
@@ -7,17 +7,22 @@ from asyncio import Future, gather, run
 from concurrent.futures import ProcessPoolExecutor
 from datetime import date
 from itertools import chain
+from logging import getLogger
 from os import cpu_count
 from random import choice
-from typing import Generator, Iterable, Optional, Tuple
+from typing import Generator, Iterable, List, Optional, Tuple
 
-from aiohttp import ClientSession
+from aiohttp import ClientResponse, ClientSession
 from bs4 import BeautifulSoup, SoupStrainer
 
+from data import cite_config, metrics
 from data.cite_config import agents, cities, headers, today, url_main
-from data.models import Stat
+from data.fetch_db import stats_cache
 from data.soup_parser import parse_data
+from data.stream_parser import StreamParser
+from data.writer import BatchWriter
 
+logger = getLogger(__name__)
 retry = set()
 
 
@@ -30,22 +35,48 @@ async def load_page(sess: ClientSession, url: str) -> Optional[Tuple[str, ...]]:
     successfully downloaded - discardes url from "retry". Number of retry
     attempts provided in "main" async function of the script.
     Also returns information of city, year and month for loaded page.
+    With STREAM_PARSE option page is parsed while it is downloaded and parsed
+    rows are returned instead of page text.
 
     :param sess: beforehand opened aiothhp ClientSession.
     :param url: url to load page text from.
-    :return: tuple with page text data, city, year and month if page was
-    successfully loaded, otherwise returns None.
+    :return: tuple with page text data (or parsed rows), city, year and month
+    if page was successfully loaded, otherwise returns None.
 
     """
     global retry
     city, year, month = url.split("/")[-4:-1]
     headers["user-agent"] = choice(agents)
-    async with sess.get(url, headers=headers) as response:
-        if response.status not in range(200, 500):
-            return retry.add(url)
-        page_text = await response.text()
+    with metrics.timer(metrics.page_seconds, "archive"):
+        async with sess.get(url, headers=headers) as response:
+            status = str(response.status)
+            metrics.increase(metrics.page_responses, "archive", status)
+            if response.status not in range(200, 500):
+                metrics.increase(metrics.page_retries)
+                return retry.add(url)
+            if not cite_config.stream_parse:
+                page_data = await response.text()
+            elif response.status == 200:
+                page_data = await stream_rows(response)
         retry.discard(url)
-    return (page_text, city, year, month) if response.status == 200 else None
+    return (page_data, city, year, month) if response.status == 200 else None
+
+
+async def stream_rows(response: ClientResponse) -> Optional[List[Tuple]]:
+    """
+    Feeds response body chunks into StreamParser as they arrive. After data
+    table end rest of page is read without parsing, so connection can be
+    reused for next requests.
+
+    :param response: aiohttp response with page.
+    :return: list with parsed weather data tuples or None if page has no data.
+
+    """
+    parser = StreamParser(response.charset or "utf-8")
+    async for chunk in response.content.iter_chunked(16384):
+        if not parser.done:
+            parser.feed(chunk)
+    return parser.close()
 
 
 def city_urls() -> Generator[str, None, None]:
@@ -96,26 +127,64 @@ async def load_page_loop(session: ClientSession, urls: Iterable[str]) -> Future:
     return await gather(*tasks)
 
 
-def archive_pages_data(load_page_result: Tuple[str, ...]) -> None:
+async def load_pages(session: ClientSession, urls: Iterable[str]) -> List:
+    """
+    Loads pages from provided URLs. If there are some pages that doesn't
+    load - retry to load them for 20 attempts or until all pages loads,
+    whichever occurs first.
+
+    :param session: beforehand opened aiothhp ClientSession.
+    :param urls: iterable with URLs to load page from.
+    :return: list with load_page results.
+
+    """
+    pages_data = await load_page_loop(session, urls)
+    for _ in range(20):
+        if retry:
+            pages_new_data = await load_page_loop(session, retry)
+            pages_data.extend(pages_new_data)
+    return pages_data
+
+
+def archive_pages_data(load_page_result: Tuple[str, ...]) -> List[Tuple]:
     """
     With provided result of load_page function creates list with Stats model
-    instances and saves all weather information in database table.
-    Weather information parses via "parse_data" function using bs4.
+    arguments tuples for all weather information from page. Runs in process
+    pool, rows are saved into database by single BatchWriter in main process.
+    Weather information parses via "parse_data" function using bs4 if page
+    was not parsed while downloading.
 
-    :param load_page_result: tuple with result of load_function with page text,
-    city name, year and month,
-    :return: None.
+    :param load_page_result: tuple with result of load_function with page text
+    or parsed rows, city name, year and month,
+    :return: list with Stat arguments tuples.
 
     """
     if not load_page_result:
-        return None
-    city_page_text, city_code, year, month = load_page_result
+        return []
+    page_data, city_code, year, month = load_page_result
     city = cities[city_code]
-    page_strainer = SoupStrainer("div", id="data_block")
-    soup = BeautifulSoup(city_page_text, "lxml", parse_only=page_strainer)
-    data = parse_data(soup)
-    datarows = [(city, get_date(year, month, row[0]), *row[1:]) for row in data]
-    Stat.add_commit([Stat(*row) for row in datarows])
+    if isinstance(page_data, str):
+        page_strainer = SoupStrainer("div", id="data_block")
+        soup = BeautifulSoup(page_data, "lxml", parse_only=page_strainer)
+        page_data = parse_data(soup)
+    data = page_data or []
+    return [(city, get_date(year, month, row[0]), *row[1:]) for row in data]
+
+
+def page_rows(load_page_result: Tuple[str, ...]) -> List[Tuple]:
+    """
+    Returns archive_pages_data result for page or empty list if page can't be
+    parsed, so one broken page doesn't stop whole archive build.
+
+    :param load_page_result: tuple with result of load_function.
+    :return: list with Stat arguments tuples.
+
+    """
+    try:
+        return archive_pages_data(load_page_result)
+    except Exception:
+        logger.exception("Failed to parse page %s", load_page_result[1:])
+        return []
 
 
 def get_date(year: str, month: str, day: str) -> date:
@@ -130,31 +199,68 @@ def get_date(year: str, month: str, day: str) -> date:
     return date(year=int(year), month=int(month), day=int(day))
 
 
+def load_chunk(city_code: str, year: int) -> List[Tuple]:
+    """
+    Loads and parses all pages of one city and year, used by archive chunk
+    Celery tasks (data.archive). Raises ConnectionError if some pages were
+    not loaded after all retry attempts, so chunk is not saved partially.
+
+    :param city_code: URL code for city.
+    :param year: year to load weather data for.
+    :return: list with Stat arguments tuples.
+
+    """
+
+    async def load_year() -> List:
+        urls = (f"{url_main}/{city_code}/{year}/{month}/" for month in range(1, 13))
+        async with ClientSession(headers=headers) as session:
+            return await load_pages(session, urls)
+
+    pages_data = run(load_year())
+    if retry:
+        failed = sorted(retry)
+        retry.clear()
+        raise ConnectionError(f"Pages were not loaded: {', '.join(failed)}")
+    return list(chain.from_iterable(map(archive_pages_data, pages_data)))
+
+
 async def main() -> None:
     """
     Main script to asynchronously load data from all pages with weather info
     from source website, parse weather data from loaded pages using
-    multiprocessing and finally save weather statistics into database.
-    If there are some pages that doesn't load - retry to load them for 20
-    attempts or until all pages loads, whichever occurs first.
+    multiprocessing (or while downloading with STREAM_PARSE option) and
+    finally save weather statistics into database via single writer.
+    Returns after all pages data is saved into database.
 
     :return: None.
 
     """
-    pool = ProcessPoolExecutor(max_workers=(cpu_count()))
     async with ClientSession(headers=headers) as session:
-        pages_data = await load_page_loop(session, all_urls())
-        for _ in range(20):
-            if retry:
-                pages_new_data = await load_page_loop(session, retry)
-                pages_data.extend(pages_new_data)
-    pool.map(archive_pages_data, pages_data)
+        pages_data = await load_pages(session, all_urls())
+    if cite_config.stream_parse:
+        with BatchWriter() as writer:
+            for page_data in pages_data:
+                writer.submit(page_rows(page_data))
+        return None
+    pool = ProcessPoolExecutor(max_workers=(cpu_count()))
+    with pool, BatchWriter() as writer:
+        for rows in pool.map(page_rows, pages_data, chunksize=8):
+            writer.submit(rows)
 
 
 def create_weather_archive() -> None:
-    """Function that executes main async script via asyncio "run" function.
+    """
+    Function that executes main async script via asyncio "run" function and
+    invalidates statistics cache after archive is created. Rebuilds DuckDB
+    mirror if it is selected as statistics backend.
 
     :return: None.
 
     """
     run(main())
+    if cite_config.stats_backend == "duckdb":
+        from data.db import engine
+        from data.duck_db import rebuild_mirror
+
+        rebuild_mirror(engine)
+    stats_cache.invalidate()
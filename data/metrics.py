@@ -0,0 +1,204 @@
+"""
+Prometheus metrics for web application, scraper and Celery worker hot paths.
+Metrics are collected only if METRICS_ENABLED environment variable is set,
+otherwise all helpers below return immediately or leave functions unwrapped.
+
+"""
+from contextlib import contextmanager
+from functools import wraps
+from logging import getLogger
+from os import environ
+from time import perf_counter
+from typing import Callable, Generator
+
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from data.cite_config import metrics_enabled, metrics_pushgateway
+
+logger = getLogger(__name__)
+enabled = metrics_enabled
+content_type = prometheus_client.CONTENT_TYPE_LATEST
+registry = CollectorRegistry()
+
+stats_seconds = Histogram(
+    "weather_stats_query_seconds",
+    "Time spent in GetStats methods.",
+    ["method"],
+    registry=registry,
+)
+report_seconds = Histogram(
+    "weather_report_render_seconds",
+    "Time spent to gather statistics and render report page.",
+    registry=registry,
+)
+page_seconds = Histogram(
+    "weather_load_page_seconds",
+    "Time spent to load page from weather source website.",
+    ["source"],
+    registry=registry,
+)
+page_responses = Counter(
+    "weather_load_page_responses_total",
+    "Responses from weather source website by status code.",
+    ["source", "status"],
+    registry=registry,
+)
+page_retries = Counter(
+    "weather_load_page_retries_total",
+    "Pages added into load_data retry set.",
+    registry=registry,
+)
+parse_seconds = Histogram(
+    "weather_parse_page_seconds",
+    "Time spent to parse weather data from one page.",
+    registry=registry,
+)
+rows_written = Histogram(
+    "weather_rows_per_commit",
+    "Number of rows written into database per Stat.add_commit call.",
+    buckets=(1, 15, 31, 100, 365, 1000, 5000),
+    registry=registry,
+)
+cache_requests = Counter(
+    "weather_cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss).",
+    ["cache", "result"],
+    registry=registry,
+)
+coalesced_requests = Counter(
+    "weather_coalesced_requests_total",
+    "Requests which waited for the same in-progress computation by result.",
+    ["result"],
+    registry=registry,
+)
+
+duckdb_fallbacks = Counter(
+    "weather_duckdb_fallbacks_total",
+    "Reports computed in SQLite instead of DuckDB mirror by reason.",
+    ["reason"],
+    registry=registry,
+)
+
+
+def timed(histogram: Histogram, *labels: str) -> Callable:
+    """
+    Decorator to observe function execution time in provided histogram.
+    If metrics are disabled returns decorated function unchanged, so there is
+    no overhead at all.
+
+    :param histogram: histogram to observe execution time in.
+    :param labels: histogram label values.
+    :return: decorator for function.
+
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if not enabled:
+            return func
+        metric = histogram.labels(*labels) if labels else histogram
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timer(histogram: Histogram, *labels: str) -> Generator[None, None, None]:
+    """Context manager to observe execution time of code block in histogram.
+
+    :param histogram: histogram to observe execution time in.
+    :param labels: histogram label values.
+    :return: generator for context manager.
+
+    """
+    if not enabled:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, perf_counter() - start, *labels)
+
+
+def observe(histogram: Histogram, value: float, *labels: str) -> None:
+    """Observes value in provided histogram if metrics are enabled.
+
+    :param histogram: histogram to observe value in.
+    :param value: value to observe.
+    :param labels: histogram label values.
+    :return: None.
+
+    """
+    if enabled:
+        (histogram.labels(*labels) if labels else histogram).observe(value)
+
+
+def increase(counter: Counter, *labels: str, amount: float = 1) -> None:
+    """Increases provided counter if metrics are enabled.
+
+    :param counter: counter to increase.
+    :param labels: counter label values.
+    :param amount: value to increase counter by.
+    :return: None.
+
+    """
+    if enabled:
+        (counter.labels(*labels) if labels else counter).inc(amount)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Counts cache lookup result, hit ratio is hit / (hit + miss) per cache.
+
+    :param cache: cache name.
+    :param hit: True if value was found in cache.
+    :return: None.
+
+    """
+    increase(cache_requests, cache, "hit" if hit else "miss")
+
+
+def export() -> bytes:
+    """
+    Returns metrics in Prometheus text format. If PROMETHEUS_MULTIPROC_DIR
+    environment variable is set, gathers metrics from all processes (WSGI
+    workers and ProcessPoolExecutor workers) that share this directory.
+
+    :return: metrics data.
+
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in environ:
+        collector = CollectorRegistry()
+        MultiProcessCollector(collector)
+        return prometheus_client.generate_latest(collector)
+    return prometheus_client.generate_latest(registry)
+
+
+def push_metrics(job: str) -> None:
+    """
+    Pushes collected metrics into Prometheus Pushgateway from METRICS_PUSHGATEWAY
+    environment variable. Used for Celery worker which has no web endpoint.
+    Push errors are only logged, so unavailable Pushgateway doesn't break
+    tasks retries.
+
+    :param job: Pushgateway job name.
+    :return: None.
+
+    """
+    if enabled and metrics_pushgateway:
+        try:
+            prometheus_client.push_to_gateway(
+                metrics_pushgateway, job=job, registry=registry
+            )
+        except OSError:
+            logger.exception("Failed to push metrics to %s", metrics_pushgateway)
@@ -1,9 +1,12 @@
 """Defines SQLAlchemy models for project weather statistics database"""
-from datetime import date
+from datetime import date, datetime
 
-from sqlalchemy import Column, Date, Integer, String
+from sqlalchemy import Column, Date, DateTime, Integer, String
+from sqlalchemy.schema import UniqueConstraint
 
-from data.db import Base, Session, engine
+from data.cite_config import stats_backend
+from data.db import Base, Session, WriterSession, engine, writer_engine
+from data.metrics import observe, rows_written
 
 
 class Stat(Base):
@@ -61,15 +64,110 @@ class Stat(Base):
         """Saves data from iterable with db.py Base instances to engine database
 
         Creates database and table on first commit if not exists.
-        Closes session after commit.
+        Closes session after commit or error, so rows can be saved again.
+        Should be called from single writer
+        (data.writer.BatchWriter) to avoid concurrent writes.
+        Adds rows into month histograms (data.histograms) in the same
+        transaction. Appends rows into DuckDB mirror if it is selected as
+        statistics backend.
 
         :param rows: iterable with rows - db.py Base instances.
         :return: None.
 
         """
         if rows:
-            session = Session()
-            Base.metadata.create_all(engine)
-            session.add_all(rows)
-            session.commit()
-            session.close()
+            from data.histograms import add_rows
+
+            session = WriterSession(expire_on_commit=False)
+            try:
+                Base.metadata.create_all(writer_engine)
+                session.add_all(rows)
+                add_rows(session, rows)
+                session.commit()
+            finally:
+                session.close()
+            observe(rows_written, len(rows))
+            if stats_backend == "duckdb":
+                from data.duck_db import mirror_rows
+
+                mirror_rows(rows)
+
+
+class ArchiveChunk(Base):
+    """
+    Creates ArchiveChunk object which tracks build progress of one part of
+    initial weather archive - all pages of one city for one year. Chunks are
+    loaded by Celery tasks (celery_task.archive_worker), so progress survives
+    workers restarts and failed chunks can be retried individually.
+
+    ArchiveChunk(city: str, year: int)
+
+    :param city: URL code for city.
+    :param year: year of weather data.
+
+    """
+
+    __tablename__ = "archive_chunk"
+    __table_args__ = (UniqueConstraint("city", "year"),)
+    chunk_id = Column(Integer, primary_key=True, autoincrement=True)
+    city = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, default=None)
+    updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, city: str, year: int) -> None:
+        self.city = city
+        self.year = year
+        self.status = "pending"
+        self.attempts = 0
+
+
+class City(Base):
+    """
+    Creates City object for city catalog (data.catalog) with city URL code on
+    weather source website and city name used in reports URLs.
+
+    City(code: str, name: str)
+
+    :param code: URL code for city.
+    :param name: city name.
+
+    """
+
+    __tablename__ = "city"
+    code = Column(String, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+    def __init__(self, code: str, name: str) -> None:
+        self.code = code
+        self.name = name
+
+
+class MonthHistogram(Base):
+    """
+    Creates MonthHistogram object with fixed-bin histogram of one weather
+    parameter for one city and month (data.histograms). Histogram counts are
+    saved as JSON object with bins lower bounds and numbers of days.
+
+    MonthHistogram(city: str, month: date, metric: str, counts: str)
+
+    :param city: city name.
+    :param month: first day of month.
+    :param metric: weather parameter name.
+    :param counts: JSON object with bins counts.
+
+    """
+
+    __tablename__ = "month_histogram"
+    city = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True)
+    metric = Column(String, primary_key=True)
+    counts = Column(String, nullable=False)
+
+    def __init__(self, city: str, month: date, metric: str, counts: str) -> None:
+        self.city = city
+        self.month = month
+        self.metric = metric
+        self.counts = counts
@@ -0,0 +1,62 @@
+"""
+Periods for comparison of weather statistics: explicit list of date ranges or
+recurring calendar pattern - the same months of every year since archive
+start, e.g. "7" for every July or "12,1,2" for every winter.
+
+"""
+from calendar import monthrange
+from datetime import date
+from typing import List, Tuple
+
+from data.fetch_db import last_day
+
+MAX_PERIODS = 100
+Period = Tuple[str, str]
+
+
+def recurring_periods(
+    months: List[int], first_year: int = 2010, last: date = last_day
+) -> List[Period]:
+    """
+    Returns period for every year covering provided consecutive months. Months
+    after December belong to the next year, so winter "12,1,2" periods start
+    in December and end in February. Periods starting after last day are
+    skipped, the last period is cut at last day.
+
+    :param months: list with consecutive months numbers.
+    :param first_year: year of the first period start.
+    :param last: last day with weather data.
+    :return: list with (begin, end) dates strings.
+
+    """
+    following = all(month == prev % 12 + 1 for prev, month in zip(months, months[1:]))
+    if not 1 <= len(months) <= 12 or not 1 <= months[0] <= 12 or not following:
+        raise ValueError(f"Months are not consecutive: {months}")
+    years_span = int(months[-1] < months[0])
+    periods = []
+    for year in range(first_year, last.year + 1):
+        begin = date(year, months[0], 1)
+        end_year = year + years_span
+        end = date(end_year, months[-1], monthrange(end_year, months[-1])[1])
+        if begin > last:
+            break
+        periods.append((begin.isoformat(), min(end, last).isoformat()))
+    return periods
+
+
+def parse_periods(text: str) -> List[Period]:
+    """
+    Returns periods from comma separated "begin:end" dates ranges, e.g.
+    "2020-07-01:2020-07-31,2021-07-01:2021-07-31".
+
+    :param text: string with periods.
+    :return: list with (begin, end) dates strings.
+
+    """
+    periods = []
+    for period in text.split(","):
+        begin, end = period.split(":")
+        if date.fromisoformat(begin) > date.fromisoformat(end):
+            raise ValueError(f"Period ends before it begins: {period}")
+        periods.append((begin, end))
+    return periods
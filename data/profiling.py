@@ -0,0 +1,108 @@
+"""
+On-demand profiling of single web requests. If PROFILING_ENABLED environment
+variable is set, request with "profile=1" query parameter or "X-Profile: 1"
+header is executed under cProfile and all SQL statements with timings are
+recorded. Results are saved into PROFILES_DIR directory.
+
+"""
+from cProfile import Profile
+from datetime import datetime
+from functools import wraps
+from json import dump
+from os import makedirs, path
+from threading import local
+from time import perf_counter
+from typing import Callable
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from data.cite_config import profiles_dir, profiling_enabled
+
+enabled = profiling_enabled
+directory = profiles_dir
+_state = local()
+
+
+def before_execute(conn, cursor, statement, params, context, executemany) -> None:
+    """SQLAlchemy event listener that saves SQL statement start time"""
+    if getattr(_state, "queries", None) is not None:
+        context.profile_start = perf_counter()
+
+
+def after_execute(conn, cursor, statement, params, context, executemany) -> None:
+    """SQLAlchemy event listener that records SQL statement and its duration"""
+    if getattr(_state, "queries", None) is not None:
+        seconds = perf_counter() - context.profile_start
+        query = {"statement": statement, "params": repr(params), "sec": seconds}
+        _state.queries.append(query)
+
+
+def profile_requested() -> bool:
+    """Checks if profiling was requested by current request query or header.
+
+    :return: True if request should be profiled, False otherwise.
+
+    """
+    flag = request.args.get("profile") or request.headers.get("X-Profile")
+    return flag in ("1", "true")
+
+
+def save_profile(profiler: Profile, seconds: float) -> str:
+    """
+    Saves cProfile stats (can be viewed with pstats, snakeviz or converted to
+    flamegraph with flameprof) and JSON file with recorded SQL statements.
+
+    :param profiler: cProfile profiler with collected stats.
+    :param seconds: full request execution time.
+    :return: name of saved profile files without extension.
+
+    """
+    makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    name = f"{timestamp}-{request.path.strip('/').replace('/', '-')}"
+    profiler.dump_stats(path.join(directory, f"{name}.prof"))
+    queries = _state.queries
+    sql_report = {
+        "url": request.full_path,
+        "request_sec": seconds,
+        "sql_count": len(queries),
+        "sql_sec": sum(query["sec"] for query in queries),
+        "queries": queries,
+    }
+    with open(path.join(directory, f"{name}.sql.json"), "w") as file:
+        dump(sql_report, file, indent=2)
+    return name
+
+
+def profiled(view: Callable) -> Callable:
+    """
+    Decorator for Flask view to profile requests that asked for profiling.
+    If profiling is disabled returns view unchanged, so unprofiled requests are
+    not affected.
+
+    :param view: Flask view function.
+    :return: view function wrapped with profiler.
+
+    """
+    if not enabled:
+        return view
+    if not event.contains(Engine, "before_cursor_execute", before_execute):
+        event.listen(Engine, "before_cursor_execute", before_execute)
+        event.listen(Engine, "after_cursor_execute", after_execute)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profile_requested():
+            return view(*args, **kwargs)
+        _state.queries = []
+        profiler = Profile()
+        start = perf_counter()
+        try:
+            return profiler.runcall(view, *args, **kwargs)
+        finally:
+            save_profile(profiler, perf_counter() - start)
+            _state.queries = None
+
+    return wrapper
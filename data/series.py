@@ -0,0 +1,109 @@
+"""
+Daily weather time series for report charts. Long periods are downsampled on
+server to requested number of points with min/max bucketing: every bucket of
+consecutive days keeps its minimal and maximal values, so peaks and the shape
+of series are preserved while payload size doesn't depend on period length.
+
+"""
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import Float, cast
+
+from data.fetch_db import session_manager
+from data.metrics import stats_seconds, timed
+from data.models import Stat
+
+series_columns = ("min_temp", "avg_temp", "max_temp", "wind_speed")
+
+
+def bucket_bounds(size: int, buckets: int) -> np.ndarray:
+    """Returns bucket number for every point of series split into equal buckets.
+
+    :param size: number of points in series.
+    :param buckets: number of buckets.
+    :return: array with bucket numbers in non-decreasing order.
+
+    """
+    return np.arange(size) * buckets // size
+
+
+def min_max_indices(values: np.ndarray, points: int) -> np.ndarray:
+    """
+    Returns sorted indices of points kept by min/max bucketing. Series is split
+    into points // 2 buckets and indices of minimal and maximal value of every
+    bucket are found at once with lexicographic sort by bucket and value.
+
+    :param values: array with series values without NaN.
+    :param points: maximal number of kept points.
+    :return: array with indices of kept points.
+
+    """
+    if len(values) <= points:
+        return np.arange(len(values))
+    buckets = bucket_bounds(len(values), max(points // 2, 1))
+    order = np.lexsort((values, buckets))
+    starts = np.flatnonzero(np.diff(buckets[order], prepend=-1))
+    ends = np.append(starts[1:], len(order)) - 1
+    return np.unique(np.concatenate((order[starts], order[ends])))
+
+
+def bucket_shares(days: np.ndarray, flags: np.ndarray, points: int) -> Dict:
+    """
+    Splits series into provided number of buckets and returns percentage of
+    True flags in every bucket with bucket first day.
+
+    :param days: array with series days.
+    :param flags: boolean array with series values.
+    :param points: number of buckets.
+    :return: dict with "days" and "values" lists.
+
+    """
+    if not len(flags):
+        return {"days": [], "values": []}
+    buckets = bucket_bounds(len(flags), min(points, len(flags)))
+    shares = np.bincount(buckets, weights=flags) / np.bincount(buckets) * 100
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    return {"days": days[starts].tolist(), "values": np.round(shares, 2).tolist()}
+
+
+@timed(stats_seconds, "get_series")
+def get_series(city: str, begin: str, end: str, points: int) -> Dict[str, Dict]:
+    """
+    Loads daily weather values for city and time period and downsamples every
+    series to provided number of points.
+
+    :param city: city to load series for.
+    :param begin: date from which load series.
+    :param end: date until which load series.
+    :param points: maximal number of points in every series.
+    :return: dict with series names and dicts with "days" and "values" lists.
+
+    """
+    with session_manager() as session:
+        rows = (
+            session.query(
+                Stat.day,
+                cast(Stat.min_temp, Float),
+                cast(Stat.avg_temp, Float),
+                cast(Stat.max_temp, Float),
+                cast(Stat.w_speed, Float),
+                Stat.weather.isnot(None),
+            )
+            .filter(Stat.city == city, Stat.day.between(begin, end))
+            .order_by(Stat.day)
+            .all()
+        )
+    days = np.array([row[0].isoformat() for row in rows], dtype=object)
+    table = np.array([row[1:5] for row in rows], dtype=float).reshape(-1, 4)
+    series = {}
+    for column, values in zip(series_columns, table.T):
+        valid = ~np.isnan(values)
+        kept = min_max_indices(values[valid], points)
+        series[column] = {
+            "days": days[valid][kept].tolist(),
+            "values": np.round(values[valid][kept], 2).tolist(),
+        }
+    flags = np.array([bool(row[5]) for row in rows])
+    series["precipitations"] = bucket_shares(days, flags, points)
+    return series
@@ -0,0 +1,77 @@
+"""
+Request coalescing for expensive computations. Concurrent callers asking for
+the same key wait for one in-progress computation and share its result or
+error instead of running the same computation in parallel.
+
+"""
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from data.metrics import coalesced_requests, increase
+
+
+class Flight:
+    """In-progress computation with its result or error for waiting callers"""
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs only one computation per key at a time within process. Callers that
+    arrive while computation for their key is running wait for it up to
+    timeout seconds and get the same result, or the same error raised.
+
+    :param timeout: maximal number of seconds to wait for computation.
+
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.lock = Lock()
+        self.flights: Dict[Hashable, Flight] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Returns result of func for key, joining in-progress call if exists.
+
+        :param key: computation key.
+        :param func: function without arguments to compute result.
+        :return: func result.
+
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            return self.wait(flight)
+        try:
+            flight.result = func()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def wait(self, flight: Flight) -> Any:
+        """Waits for computation of another caller and returns its result.
+
+        :param flight: in-progress computation.
+        :return: computation result.
+
+        """
+        if not flight.done.wait(self.timeout):
+            increase(coalesced_requests, "timeout")
+            raise TimeoutError(f"Computation is not finished in {self.timeout} s")
+        if flight.error is not None:
+            increase(coalesced_requests, "error")
+            raise flight.error
+        increase(coalesced_requests, "shared")
+        return flight.result
@@ -1,9 +1,15 @@
 """Gathers weather statistics data from weather archive site via bs4"""
+from re import compile
 from typing import Iterator, Optional, Tuple
 
 from bs4 import Tag
 
+from data.metrics import parse_seconds, timed
 
+number_pattern = compile(r"^\s*[+-]?\d+(\.\d+)?")
+
+
+@timed(parse_seconds)
 def parse_data(soup: Tag) -> Optional[Iterator[Tuple[str, ...]]]:
     """Returns weather data from provided BeautifulSoup Tag.
 
@@ -64,3 +70,16 @@ def dir_eng(wind_dir: str) -> str:
     for direction in dictionary:
         wind_dir = wind_dir.replace(direction[0], direction[1])
     return wind_dir
+
+
+def leading_number(value: str) -> Optional[float]:
+    """
+    Returns number from beginning of parsed weather value text, e.g. 5.0 for
+    "+5" or 3.0 for "3m/s", or None if text doesn't start with number.
+
+    :param value: weather value text.
+    :return: numeric value.
+
+    """
+    match = number_pattern.match(value)
+    return float(match.group()) if match else None
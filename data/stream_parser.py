@@ -0,0 +1,119 @@
+"""
+Incremental parser of weather archive pages. Page text is fed by chunks while
+it is downloaded, rows of "div#data_block" table are parsed as soon as they
+are complete and parsing stops after the table end, so neither whole page
+text nor page tree are kept in memory. Parses the same values as
+data.soup_parser.parse_data.
+
+"""
+from codecs import getincrementaldecoder
+from typing import List, Optional, Tuple
+
+from lxml import etree
+
+from data.soup_parser import dir_eng, get_weather, speed_eng
+
+
+def has_class(element: etree._Element, name: str) -> bool:
+    """Checks if element has provided name in "class" attribute"""
+    return name in element.get("class", "").split()
+
+
+def element_text(element: Optional[etree._Element]) -> str:
+    """Returns text of element with all its descendants"""
+    return "".join(element.itertext()) if element is not None else ""
+
+
+def cell_at(cells: List[etree._Element], index: int) -> Optional[etree._Element]:
+    """Returns row cell by index or None if row has less cells"""
+    return cells[index] if index < len(cells) else None
+
+
+def parse_row(row: etree._Element) -> Tuple[Optional[str], ...]:
+    """
+    Returns weather data from table row: day, day temperature, evening
+    temperature, precipitations, wind direction and wind speed. Values are
+    found by offsets from first "first_in_group" cell: +3 phenomena, +4 wind
+    and +5 evening temperature cell.
+
+    :param row: complete "tr" element.
+    :return: tuple with weather data strings.
+
+    """
+    cells = row.findall("td")
+    day = next(element_text(cell) for cell in cells if has_class(cell, "first"))
+    group = [i for i, cell in enumerate(cells) if has_class(cell, "first_in_group")]
+    if not group:
+        return day, None, None, None, "", ""
+    start = group[0]
+    phenomena, wind_cell, evening = (cell_at(cells, start + i) for i in (3, 4, 5))
+    pic = phenomena.find(".//img") if phenomena is not None else None
+    wind = element_text(wind_cell).split()
+    return (
+        day,
+        element_text(cells[start]),
+        element_text(evening) if evening is not None else None,
+        get_weather(pic.attrib) if pic is not None else None,
+        dir_eng(wind[0]) if wind else "",
+        speed_eng(wind[-1]) if wind else "",
+    )
+
+
+class StreamParser:
+    """
+    Feeds page chunks into lxml HTMLPullParser and collects parsed rows of
+    "div#data_block" table. Elements outside of data block and processed rows
+    are cleared as soon as they end.
+
+    :param encoding: page text encoding.
+
+    """
+
+    def __init__(self, encoding: str = "utf-8") -> None:
+        self.decoder = getincrementaldecoder(encoding)(errors="replace")
+        self.parser = etree.HTMLPullParser(events=("start", "end"))
+        self.in_block = False
+        self.done = False
+        self.rows: List[Tuple[Optional[str], ...]] = []
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parses next page chunk.
+
+        :param chunk: next bytes of page.
+        :return: True if data table is complete and rest of page is not needed.
+
+        """
+        if not self.done:
+            self.parser.feed(self.decoder.decode(chunk))
+            self.handle_events()
+        return self.done
+
+    def close(self) -> Optional[List[Tuple[Optional[str], ...]]]:
+        """
+        Finishes parsing and returns parsed rows or None if page has no data
+        table, like parse_data does.
+
+        :return: list with weather data string tuples.
+
+        """
+        if not self.done:
+            self.parser.feed(self.decoder.decode(b"", final=True))
+            self.parser.close()
+            self.handle_events()
+        return self.rows if self.done else None
+
+    def handle_events(self) -> None:
+        """Processes events of elements parsed from fed chunks"""
+        for event, element in self.parser.read_events():
+            if self.done:
+                break
+            if event == "start":
+                if element.tag == "div" and element.get("id") == "data_block":
+                    self.in_block = True
+            elif not self.in_block:
+                element.clear()
+            elif element.tag == "table":
+                self.done = True
+            elif element.tag == "tr" and element.get("align") == "center":
+                self.rows.append(parse_row(element))
+                element.clear()
@@ -0,0 +1,134 @@
+"""
+Deterministic synthetic weather data generator for benchmarks and load tests.
+Generates rows in the same format as parsed from weather source website, with
+seasonal temperatures, random weather anomalies, precipitations and winds.
+
+"""
+from datetime import date, timedelta
+from math import cos, pi
+from random import Random
+from typing import Dict, Generator, Iterable, List, Tuple
+
+from sqlalchemy.engine import Engine
+
+from data.cite_config import cities
+from data.histograms import rebuild_histograms
+from data.models import Base, Stat
+
+directions = ["N", "NE", "E", "SE", "S", "SW", "W", "NW", "Calm"]
+fields = ["city", "day", "max_temp", "min_temp", "weather", "w_direction"]
+
+
+def synthetic_cities(number: int) -> List[str]:
+    """
+    Returns list with city names: cities from config first, then generated
+    "city-<index>" names if more cities requested.
+
+    :param number: number of cities.
+    :return: list with city names.
+
+    """
+    names = list(cities.values())[:number]
+    extra = (f"city-{index}" for index in range(len(names), number))
+    return names + list(extra)
+
+
+def city_weather(
+    city: str, first_day: date, last_day: date, seed: int = 0
+) -> Generator[Tuple[str, ...], None, None]:
+    """
+    Generates weather rows for city and period. Every city has its own random
+    generator seeded with city name and always starts generation from
+    2010-01-01, so rows don't depend on other cities or requested period start.
+
+    :param city: city name.
+    :param first_day: first date of period.
+    :param last_day: last date of period.
+    :param seed: seed for random generators.
+    :return: generator which yields Stat arguments tuples.
+
+    """
+    rng = Random(f"{seed}-{city}")
+    mean, amplitude = rng.uniform(-5, 25), rng.uniform(3, 20)
+    spread, rain_chance = rng.uniform(4, 12), rng.uniform(0.15, 0.5)
+    winds = [rng.random() for _ in directions]
+    anomaly, day = 0.0, min(first_day, date(2010, 1, 1))
+    while day <= last_day:
+        anomaly = 0.7 * anomaly + rng.gauss(0, 3)
+        season = cos(2 * pi * (day.timetuple().tm_yday - 200) / 365.25)
+        temp = mean + amplitude * season + anomaly
+        max_temp = round(temp + spread / 2 + rng.random())
+        min_temp = round(temp - spread / 2 - rng.random())
+        weather = None
+        if rng.random() < rain_chance:
+            weather = rng.choice(["snow"] if temp < 0 else ["rain", "storm"])
+        w_direction = rng.choices(directions, weights=winds)[0]
+        w_speed = 0 if w_direction == "Calm" else rng.randint(1, 12)
+        if day >= first_day:
+            yield (
+                city,
+                day,
+                f"{max_temp:+d}",
+                f"{min_temp:+d}",
+                weather,
+                w_direction,
+                f"{w_speed}m/s",
+            )
+        day += timedelta(days=1)
+
+
+def synthetic_rows(
+    city_names: Iterable[str], first_day: date, last_day: date, seed: int = 0
+) -> Generator[Tuple[str, ...], None, None]:
+    """Generates weather rows for all provided cities and period.
+
+    :param city_names: iterable with city names.
+    :param first_day: first date of period.
+    :param last_day: last date of period.
+    :param seed: seed for random generators.
+    :return: generator which yields Stat arguments tuples.
+
+    """
+    for city in city_names:
+        yield from city_weather(city, first_day, last_day, seed)
+
+
+def row_values(row: Tuple[str, ...]) -> Dict[str, object]:
+    """Converts Stat arguments tuple to dict with "statistic" table values.
+
+    :param row: Stat arguments tuple.
+    :return: dict with column values.
+
+    """
+    values = dict(zip(fields, row), w_speed=row[-1])
+    avg_temp = (int(values["max_temp"]) + int(values["min_temp"])) / 2
+    values["avg_temp"] = f"{avg_temp:+.2f}"
+    return values
+
+
+def populate(
+    engine: Engine, city_names: Iterable[str], first_day: date, last_day: date
+) -> int:
+    """
+    Creates "statistic" table in provided database engine and fills it with
+    synthetic weather rows via bulk inserts, then builds month histograms.
+
+    :param engine: SQLAlchemy engine for database to fill.
+    :param city_names: iterable with city names.
+    :param first_day: first date of period.
+    :param last_day: last date of period.
+    :return: number of inserted rows.
+
+    """
+    Base.metadata.create_all(engine, tables=[Stat.__table__])
+    count, batch = 0, []
+    with engine.begin() as connection:
+        for row in synthetic_rows(city_names, first_day, last_day):
+            batch.append(row_values(row))
+            if len(batch) == 10000:
+                connection.execute(Stat.__table__.insert(), batch)
+                count, batch = count + len(batch), []
+        if batch:
+            connection.execute(Stat.__table__.insert(), batch)
+    rebuild_histograms(engine)
+    return count + len(batch)
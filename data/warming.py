@@ -0,0 +1,146 @@
+"""
+Statistics cache warming after daily data ingest. Precomputes reports for
+standard periods ("last N days") for all cities and for the most popular
+periods requested recently according to reports access log. Dates are
+computed on every call, so long-running Celery workers warm periods for the
+current day.
+
+"""
+from collections import Counter
+from datetime import date, timedelta
+from logging import getLogger
+from os import makedirs, path, remove, scandir
+from typing import List, Optional, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from data.catalog import city_index, normalize_name
+from data.cite_config import cache_dir, cities
+from data.fetch_db import create_stats
+
+logger = getLogger(__name__)
+Period = Tuple[str, str, str]
+
+
+def access_log_path(day: date) -> str:
+    """Returns reports access log file path for provided day.
+
+    :param day: day of access log.
+    :return: access log file path in cache directory.
+
+    """
+    return path.join(cache_dir, f"access-{day.isoformat()}.log")
+
+
+def log_report_request(city: str, begin: str, end: str) -> None:
+    """
+    Appends requested report period into today's access log if cache directory
+    is configured and city is catalog city name. Line is written with single
+    append, so concurrent writes from different processes don't mix. Errors
+    are only logged, so access logging never fails report request.
+
+    :param city: requested city.
+    :param begin: requested report start date.
+    :param end: requested report end date.
+    :return: None.
+
+    """
+    if not cache_dir:
+        return None
+    try:
+        if normalize_name(city) != city or city_index().code(city) is None:
+            return None
+        makedirs(cache_dir, exist_ok=True)
+        with open(access_log_path(date.today()), "a") as log:
+            log.write(f"{city} {begin} {end}\n")
+    except (OSError, SQLAlchemyError):
+        logger.exception("Failed to write reports access log")
+
+
+def parse_line(line: str) -> Optional[Period]:
+    """Returns (city, begin, end) period from access log line.
+
+    :param line: access log line.
+    :return: period tuple or None for malformed line.
+
+    """
+    fields = line.split()
+    if len(fields) != 3:
+        return None
+    try:
+        date.fromisoformat(fields[1]), date.fromisoformat(fields[2])
+    except ValueError:
+        return None
+    return fields[0], fields[1], fields[2]
+
+
+def popular_periods(limit: int, days: int, until: date) -> List[Period]:
+    """Returns most requested report periods from access logs for last days.
+
+    :param limit: number of periods to return.
+    :param days: number of days to read access logs for.
+    :param until: last day to read access log for.
+    :return: list with (city, begin, end) tuples.
+
+    """
+    requests = Counter()
+    for day_offset in range(days):
+        log_path = access_log_path(until - timedelta(days=day_offset))
+        if path.isfile(log_path):
+            with open(log_path) as log:
+                requests.update(filter(None, map(parse_line, log)))
+    return [period for period, _ in requests.most_common(limit)]
+
+
+def standard_periods(periods: List[int], last_day: date) -> List[Period]:
+    """Returns "last N days" periods until last_day for all cities.
+
+    :param periods: list with periods lengths in days.
+    :param last_day: last day of periods.
+    :return: list with (city, begin, end) tuples.
+
+    """
+    end = last_day.isoformat()
+    begins = [(last_day - timedelta(days=days - 1)).isoformat() for days in periods]
+    return [(city, begin, end) for city in cities.values() for begin in begins]
+
+
+def remove_old_logs(days: int, until: date) -> None:
+    """Removes access logs older than provided number of days.
+
+    :param days: number of days to keep access logs for.
+    :param until: last day of kept access logs.
+    :return: None.
+
+    """
+    keep = {access_log_path(until - timedelta(days=n)) for n in range(days)}
+    for entry in scandir(cache_dir):
+        if entry.name.startswith("access-") and entry.path not in keep:
+            remove(entry.path)
+
+
+def warm_cache(periods: List[int], top: int, log_days: int) -> int:
+    """
+    Computes reports statistics for standard and popular periods, so results
+    are saved in shared statistics cache before users request them.
+
+    :param periods: list with standard periods lengths in days.
+    :param top: number of most popular requested periods to warm.
+    :param log_days: number of days to keep and read access logs for.
+    :return: number of warmed periods.
+
+    """
+    if not cache_dir:
+        return 0
+    today = date.today()
+    warm = standard_periods(periods, today - timedelta(days=1))
+    warm += popular_periods(top, log_days, today)
+    stats, warmed = create_stats(), 0
+    for city, begin, end in dict.fromkeys(warm):
+        try:
+            stats.get_report(city, begin, end)
+            warmed += 1
+        except Exception:
+            logger.exception("Failed to warm report %s %s %s", city, begin, end)
+    remove_old_logs(log_days, today)
+    return warmed
@@ -0,0 +1,115 @@
+"""
+Single writer for weather data ingestion. Producers (archive build event loop,
+process pool results, Celery tasks) submit batches of parsed rows into queue
+and only one thread writes them into database, joining queued batches into
+bigger transactions. Together with WAL mode this keeps writes from competing
+with each other and with web application reads. Invalid rows are skipped and
+failed batches are dropped without stopping the writer, so one bad page
+doesn't lose the rest of ingested data.
+
+"""
+from logging import getLogger
+from queue import Queue
+from threading import Thread
+from typing import List, Optional, Tuple
+
+from data.models import Stat
+
+logger = getLogger(__name__)
+STOP = None
+
+
+class BatchWriter:
+    """
+    Starts writer thread which saves submitted rows into database via
+    Stat.add_commit. Use as context manager: on exit all submitted rows are
+    written and first write error (if any) is raised. If joined transaction
+    fails, its batches are written one by one, so only failing batches are
+    dropped.
+
+    :param max_rows: maximal number of rows written in one transaction.
+    :param max_batches: queue size, producers wait if writer falls behind.
+
+    """
+
+    def __init__(self, max_rows: int = 5000, max_batches: int = 100) -> None:
+        self.max_rows = max_rows
+        self.queue: Queue = Queue(maxsize=max_batches)
+        self.error: Optional[Exception] = None
+        self.skipped = 0
+        self.thread = Thread(target=self.run, name="batch-writer", daemon=True)
+
+    def __enter__(self) -> "BatchWriter":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.queue.put(STOP)
+        self.thread.join()
+        if self.error and not exc_info[0]:
+            raise self.error
+
+    def submit(self, rows: List[Tuple]) -> None:
+        """
+        Creates Stat instances from batch of Stat arguments tuples and adds
+        them into writer queue. Rows which can't be converted, e.g. without
+        temperatures, are logged and skipped.
+
+        :param rows: list with Stat arguments tuples.
+        :return: None.
+
+        """
+        stats = []
+        for row in rows:
+            try:
+                stats.append(Stat(*row))
+            except (TypeError, ValueError):
+                self.skipped += 1
+                logger.warning("Skipped invalid weather row: %s", row)
+        if stats:
+            self.queue.put(stats)
+
+    def run(self) -> None:
+        """Writer thread loop: joins queued batches and writes them until stop"""
+        stopped = False
+        while not stopped:
+            batch = self.queue.get()
+            if batch is STOP:
+                break
+            batches, size = [batch], len(batch)
+            while size < self.max_rows and not self.queue.empty():
+                batch = self.queue.get()
+                if batch is STOP:
+                    stopped = True
+                    break
+                batches.append(batch)
+                size += len(batch)
+            self.write(batches)
+
+    def write(self, batches: List[List[Stat]]) -> None:
+        """
+        Writes batches in one transaction. If it fails, writes every batch in
+        separate transaction and drops only failed batches. Saves first error
+        instead of raising it.
+
+        :param batches: list with lists of Stat instances.
+        :return: None.
+
+        """
+        try:
+            Stat.add_commit([row for batch in batches for row in batch])
+            return None
+        except Exception as error:
+            if len(batches) == 1:
+                self.drop(batches[0], error)
+                return None
+        for batch in batches:
+            try:
+                Stat.add_commit(batch)
+            except Exception as error:
+                self.drop(batch, error)
+
+    def drop(self, batch: List[Stat], error: Exception) -> None:
+        """Logs failed batch and saves first write error"""
+        logger.error("Dropped %s weather rows: %r", len(batch), error)
+        self.error = self.error or error
@@ -0,0 +1,54 @@
+"""
+Gunicorn configuration for production serving of Flask application:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Application is preloaded in master process, so workers share its memory pages
+and SECRET_KEY, statistics cache is shared by workers via CACHE_DIR.
+
+"""
+from os import cpu_count, environ, path
+
+bind = environ.get("WEB_BIND", "0.0.0.0:5000")
+workers = int(environ.get("WEB_WORKERS", cpu_count() * 2 + 1))
+threads = int(environ.get("WEB_THREADS", 1))
+preload_app = True
+
+
+def on_starting(server) -> None:
+    """
+    Creates weather archive before workers start if database doesn't exist.
+    With ARCHIVE_BUILD=celery archive is built by Celery workers in chunks.
+    Builds month histograms for existing database if they are missing.
+
+    """
+    from data.cite_config import archive_build
+    from data.db import DB_PATH
+    from data.load_data import create_weather_archive
+
+    if path.isfile(DB_PATH):
+        from data.db import writer_engine
+        from data.histograms import ensure_histograms
+
+        return ensure_histograms(writer_engine)
+    if archive_build == "celery":
+        from celery_task.archive_worker import build_archive
+
+        build_archive.delay()
+    else:
+        create_weather_archive()
+
+
+def post_fork(server, worker) -> None:
+    """Drops database connections inherited by worker from master process"""
+    from data.db import engine
+
+    engine.dispose()
+
+
+def child_exit(server, worker) -> None:
+    """Removes metrics files of exited worker in Prometheus multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
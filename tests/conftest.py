@@ -1,21 +1,26 @@
 """Fixtures for pytest tests"""
-from datetime import datetime
+from datetime import date, datetime
 from typing import Generator, List
 from unittest.mock import patch
 
 from bs4 import BeautifulSoup, SoupStrainer, Tag
 from flask.testing import FlaskClient
 from pytest import fixture
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
 
 from app import app
-from data.cite_config import today
+from data.catalog import CityIndex
+from data.cite_config import cities, today
 from data.fetch_db import last_day
 from data.models import Base, Session, Stat, engine
+from data.synthetic import populate
 from tests.db_config import engine, session
 
 
 @fixture(scope="function")
-def client(request) -> Generator[FlaskClient, None, None]:
+def client() -> Generator[FlaskClient, None, None]:
     """
     Prepares flask application for testing, and binds to test temporary database
 
@@ -33,10 +38,6 @@ def client(request) -> Generator[FlaskClient, None, None]:
         ]
         session.add_all(rows)
         session.commit()
-        with client.session_transaction() as sess:
-            date_str = datetime.strftime(today, "%Y-%m-%d")
-            sess["city"] = request.param
-            sess["date_from"] = sess["date_until"] = date_str
         yield client
     app.config["TESTING"] = False
     app.config["SERVER_NAME"] = "0.0.0.0:5000"
@@ -46,12 +47,13 @@ def client(request) -> Generator[FlaskClient, None, None]:
 @patch("data.fetch_db.session_manager", return_value=session, autospec=True)
 def page(mock_session_manager, client) -> str:
     """
-    Returns page data for response of "/reports/default" web page URL
+    Returns page data for response of "/reports/default" web page URL for today
 
     :return: statistics report page data.
 
     """
-    rv = client.get("/reports/default")
+    date_str = datetime.strftime(today, "%Y-%m-%d")
+    rv = client.get(f"/reports/default?from={date_str}&until={date_str}")
     return rv.data
 
 
@@ -108,3 +110,43 @@ def mock_page() -> Generator[Tag, None, None]:
     page_strainer = SoupStrainer("div", id="data_block")
     soup = BeautifulSoup(text, "lxml", parse_only=page_strainer)
     yield soup
+
+
+@fixture
+def catalog() -> Generator[CityIndex, None, None]:
+    """
+    Replaces city catalog index with index over cities from config, so tests
+    don't need catalog table in database.
+
+    :return: generator that yields CityIndex instance.
+
+    """
+    index = CityIndex({name: code for code, name in cities.items()})
+    with patch("app.city_index", return_value=index):
+        with patch("data.forms.city_index", return_value=index):
+            with patch("data.warming.city_index", return_value=index):
+                yield index
+
+
+@fixture
+def file_engine(tmp_path) -> Engine:
+    """Returns engine for empty SQLite database file in temporary directory
+
+    :return: SQLAlchemy Engine instance.
+
+    """
+    return create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@fixture
+def synthetic_db(file_engine) -> Generator[Engine, None, None]:
+    """
+    Fills database file with synthetic "moscow" weather from 2015-01-01 till
+    last day and binds statistics queries to it.
+
+    :return: generator that yields SQLAlchemy Engine instance for database.
+
+    """
+    populate(file_engine, ["moscow"], date(2015, 1, 1), last_day)
+    with patch("data.fetch_db.Session", sessionmaker(bind=file_engine)):
+        yield file_engine
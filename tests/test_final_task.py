@@ -1,37 +1,61 @@
 """Tests for final_task to run with pytest"""
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from multiprocessing import get_context
+from threading import Event
+from time import sleep
+from typing import Dict, Tuple
 from unittest.mock import patch
 
-from pytest import mark
+import duckdb
+import numpy as np
+from bs4 import BeautifulSoup, SoupStrainer
+from pytest import approx, mark, raises
+from sqlalchemy import create_engine
+from sqlalchemy.event import listen
+from sqlalchemy.orm import sessionmaker
 
+from benchmarks.mock_diary import render_page
+from data import archive, duck_db, metrics, profiling
+from data.cache import SharedCache
 from data.cite_config import today
-from data.fetch_db import GetStats
+from data.db import Base
+from data.duck_stats import DuckStats
+from data.fetch_db import GetStats, last_day
+from data.histograms import ensure_histograms, is_built, percentile
+from data.load_data import page_rows
+from data.models import Stat
+from data.periods import parse_periods, recurring_periods
+from data.series import min_max_indices
+from data.singleflight import SingleFlight
 from data.soup_parser import parse_data
+from data.stream_parser import StreamParser
+from data.synthetic import synthetic_cities, synthetic_rows
+from data.warming import log_report_request, popular_periods, warm_cache
+from data.writer import BatchWriter
 from tests.db_config import session
 
 
-@mark.parametrize("client", ["default"], indirect=True)
 def test_index(client):
     """Tests correct behaviour for web site index page"""
     rv = client.get("/not/exists/page")
     assert rv.status == "404 NOT FOUND"
 
 
-@mark.parametrize("client", ["default"], indirect=True)
 def test_404(client):
     """Tests correct behaviour for web site page in cases of 404 error"""
     rv = client.get("/not/exists/page")
     assert rv.status == "404 NOT FOUND"
 
 
-@mark.parametrize("client", ["random_city"], indirect=True)
 def test_500(client):
     """Tests correct behaviour for web site page in cases of 500 error"""
-    rv = client.get("/reports/default")
+    day = datetime.strftime(today, "%Y-%m-%d")
+    rv = client.get(f"/reports/random_city?from={day}&until={day}")
     assert rv.status == "500 INTERNAL SERVER ERROR"
 
 
-@mark.parametrize("client", ["default"], indirect=True)
 def test_main_application(statistics_parse, page, client, parse_result):
     """Tests correct behaviour for web page with generated weather statistics"""
     assert statistics_parse == parse_result
@@ -99,3 +123,458 @@ def test_parse_data(mock_page):
     """Tests correct behaviour for weather parameters parser function"""
     data = parse_data(mock_page)
     assert ("1", "-10", "-14", None, "N", "1m/s") == list(data)[0]
+
+
+def test_metrics_disabled(client):
+    """Tests that metrics page is not available if metrics are disabled"""
+    with patch("data.metrics.enabled", False):
+        rv = client.get("/metrics")
+    assert rv.status == "404 NOT FOUND"
+
+
+def test_metrics_enabled(client):
+    """Tests correct behaviour for metrics page if metrics are enabled"""
+    with patch("data.metrics.enabled", True):
+        metrics.record_cache("test", hit=True)
+        rv = client.get("/metrics")
+    assert rv.status == "200 OK"
+    assert b'weather_cache_requests_total{cache="test",result="hit"}' in rv.data
+
+
+def test_timed_disabled():
+    """Tests that functions are not wrapped with timer if metrics are disabled"""
+    with patch("data.metrics.enabled", False):
+        wrapped = metrics.timed(metrics.parse_seconds)(parse_data)
+    assert wrapped is parse_data
+
+
+def test_push_metrics_unavailable():
+    """Tests that unavailable Pushgateway doesn't raise errors in tasks"""
+    with patch("data.metrics.enabled", True):
+        with patch("data.metrics.metrics_pushgateway", "127.0.0.1:1"):
+            metrics.push_metrics("test")
+
+
+def test_profiled_request(client, tmp_path):
+    """Tests that requests with profile flag save cProfile stats and SQL log"""
+    with patch("data.profiling.enabled", True):
+        view = profiling.profiled(lambda: session.execute("SELECT 1").scalar())
+    with patch("data.profiling.directory", str(tmp_path)):
+        with client.application.test_request_context("/reports/x?profile=1"):
+            assert view() == 1
+        with client.application.test_request_context("/reports/x"):
+            assert view() == 1
+    files = sorted(file.name for file in tmp_path.iterdir())
+    assert len(files) == 2
+    assert files[0].endswith("reports-x.prof")
+    assert '"sql_count": 1' in (tmp_path / files[1]).read_text()
+
+
+def test_synthetic_rows():
+    """Tests that synthetic data generator is deterministic for every city"""
+    first_day, last_day = date(2020, 1, 1), date(2020, 12, 31)
+    city_names = synthetic_cities(20)
+    rows = list(synthetic_rows(city_names, first_day, last_day))
+    city_rows = list(synthetic_rows(city_names[-1:], first_day, last_day))
+    assert len(set(city_names)) == 20
+    assert len(rows) == 20 * 366
+    assert rows[-366:] == city_rows
+
+
+def test_mock_diary_page():
+    """Tests that mock diary server pages are parsed as source website pages"""
+    rows = list(synthetic_rows(["moscow"], date(2020, 1, 1), date(2020, 1, 31)))
+    strainer = SoupStrainer("div", id="data_block")
+    soup = BeautifulSoup(render_page(rows), "lxml", parse_only=strainer)
+    parsed = list(parse_data(soup))
+    assert len(parsed) == 31
+    assert [(str(row[1].day), *row[2:]) for row in rows] == parsed
+
+
+def test_shared_cache(tmp_path):
+    """Tests shared cache values saving and invalidation for all cache names"""
+    cache, other_cache = SharedCache(str(tmp_path), "a"), SharedCache(
+        str(tmp_path), "b"
+    )
+    cache.set(("key", 1), {"value": [1, 2]})
+    other_cache.set(("key", 1), "other")
+    assert cache.get(("key", 1)) == {"value": [1, 2]}
+    assert other_cache.get(("key", 1)) == "other"
+    cache.invalidate()
+    assert cache.get(("key", 1)) is None
+    assert other_cache.get(("key", 1)) is None
+    started = cache.generation()
+    cache.invalidate()
+    cache.set(("key", 1), "stale", started)
+    assert cache.get(("key", 1)) is None
+    assert SharedCache(None, "disabled").get(("key", 1)) is None
+
+
+@patch("data.fetch_db.session_manager", return_value=session, autospec=True)
+def test_get_report_cache(mock_session_manager, mock_db, tmp_path):
+    """Tests that report statistics are loaded from shared cache on second call"""
+    day = datetime.strftime(today, "%Y-%m-%d")
+    with patch("data.fetch_db.stats_cache", SharedCache(str(tmp_path), "stats")):
+        result = GetStats().get_report("default", day, day)
+        with patch.object(GetStats, "get_max_temp") as mock_max_temp:
+            cached_result = GetStats().get_report("default", day, day)
+    assert mock_max_temp.call_count == 0
+    assert result["max_temp"] == cached_result["max_temp"] == 100
+
+
+def test_index_redirect(client, catalog):
+    """Tests that index form redirects to report page with period in URL"""
+    form = {"city": "moscow", "date_from": "2020-01-01", "date_until": "2020-01-31"}
+    with patch.dict(client.application.config, {"WTF_CSRF_ENABLED": False}):
+        rv = client.post("/", data=form)
+        typed_rv = client.post("/", data=dict(form, city=" Saint Petersburg "))
+    assert rv.status == "302 FOUND"
+    assert rv.location.endswith("/reports/moscow?from=2020-01-01&until=2020-01-31")
+    assert "/reports/saint-petersburg?" in typed_rv.location
+
+
+def test_index_unknown_city(client, catalog):
+    """Tests that index form is not submitted for city missing in catalog"""
+    form = {"city": "atlantis", "date_from": "2020-01-01", "date_until": "2020-01-31"}
+    with patch.dict(client.application.config, {"WTF_CSRF_ENABLED": False}):
+        rv = client.post("/", data=form)
+    assert rv.status == "200 OK"
+
+
+def test_cities_search(client, catalog):
+    """Tests city catalog search by name prefix and by name word prefix"""
+    assert catalog.search("Sa") == ["saint-petersburg"]
+    assert catalog.search("peter") == ["saint-petersburg"]
+    assert catalog.search("") == []
+    assert catalog.code("moscow") == "4368"
+    assert catalog.code("Moscow") == "4368"
+    rv = client.get("/cities?q=n&limit=2")
+    assert rv.json == ["new-deli", "novosibirsk"]
+
+
+@patch("data.fetch_db.session_manager", return_value=session, autospec=True)
+def test_report_page_cache(mock_session_manager, client, tmp_path):
+    """Tests that past periods reports are cached and served with validators"""
+    day = datetime.strftime(last_day, "%Y-%m-%d")
+    url = f"/reports/default?from={day}&until={day}"
+    with patch("app.page_cache", SharedCache(str(tmp_path), "page")):
+        rv = client.get(url)
+        with patch.object(GetStats, "get_report") as mock_get_report:
+            cached_rv = client.get(url)
+            not_modified_rv = client.get(
+                url, headers={"If-None-Match": rv.headers["ETag"]}
+            )
+    assert mock_get_report.call_count == 0
+    assert rv.status == cached_rv.status == "200 OK"
+    assert rv.data == cached_rv.data
+    assert "public" in rv.headers["Cache-Control"]
+    assert not_modified_rv.status == "304 NOT MODIFIED"
+
+
+def test_report_without_period(client):
+    """Tests that report page without valid period parameters is not found"""
+    rv = client.get("/reports/default?from=2020-01-01&until=yesterday")
+    assert rv.status == "404 NOT FOUND"
+
+
+def test_warm_cache(tmp_path, catalog):
+    """Tests cache warming for standard periods and popular requested periods"""
+    with patch("data.warming.cache_dir", str(tmp_path)):
+        for _ in range(3):
+            log_report_request("moscow", "2020-01-01", "2020-12-31")
+        log_report_request("sochi", "2021-01-01", "2021-12-31")
+        log_report_request("mos\tcow", "2020-01-01", "2020-12-31")
+        log_report_request("atlantis", "2020-01-01", "2020-12-31")
+        with open(tmp_path / f"access-{date.today()}.log", "a") as log:
+            log.write("moscow 2020-01-01 2020-12-31 extra\nmoscow x y\n")
+        popular = popular_periods(1, 7, date.today())
+        assert popular == [("moscow", "2020-01-01", "2020-12-31")]
+        with patch.object(GetStats, "get_report") as mock_get_report:
+            warmed = warm_cache([7, 30], 2, 7)
+    assert warmed == mock_get_report.call_count == 15 * 2 + 2
+    mock_get_report.assert_any_call("sochi", "2021-01-01", "2021-12-31")
+    with patch("data.warming.cache_dir", str(tmp_path / "missing")):
+        log_report_request("moscow", "2020-01-01", "2020-12-31")
+    assert (tmp_path / "missing" / f"access-{date.today()}.log").is_file()
+
+
+def test_batch_writer(file_engine):
+    """Tests that all rows submitted to single writer are saved into database"""
+    rows = list(synthetic_rows(["moscow"], date(2020, 1, 1), date(2020, 12, 31)))
+    with patch("data.models.writer_engine", file_engine):
+        with patch("data.models.WriterSession", sessionmaker(bind=file_engine)):
+            with BatchWriter(max_rows=100, max_batches=5) as writer:
+                for row in rows:
+                    writer.submit([row])
+    with file_engine.connect() as connection:
+        count = connection.execute("SELECT count(*) FROM statistic").scalar()
+    assert count == 366
+
+
+def test_batch_writer_invalid_rows(file_engine):
+    """Tests that invalid rows are skipped and following batches are saved"""
+    rows = list(synthetic_rows(["moscow"], date(2020, 1, 1), date(2020, 12, 31)))
+    invalid = ("moscow", date(2020, 1, 11), None, None, None, "", "")
+    with patch("data.models.writer_engine", file_engine):
+        with patch("data.models.WriterSession", sessionmaker(bind=file_engine)):
+            with BatchWriter(max_rows=100, max_batches=5) as writer:
+                writer.submit(rows[:10])
+                writer.submit([invalid, *rows[10:20]])
+                writer.submit(rows[20:])
+    with file_engine.connect() as connection:
+        count = connection.execute("SELECT count(*) FROM statistic").scalar()
+    assert count == 366 and writer.skipped == 1
+    assert page_rows(("<html></html>", "unknown", "2020", "1")) == []
+
+
+def test_duckdb_backend(synthetic_db, tmp_path):
+    """Tests that DuckDB mirror returns the same reports as SQLite database"""
+    first_day = date(2015, 1, 1)
+    begin, end = first_day.isoformat(), last_day.isoformat()
+    with patch.object(duck_db, "database_path", str(tmp_path / "test.duckdb")):
+        assert duck_db.rebuild_mirror(synthetic_db) == (last_day - first_day).days + 1
+        duck_report = DuckStats().get_report("moscow", begin, end)
+        cache, key = SharedCache(str(tmp_path), "stats"), (
+            "DuckStats",
+            "moscow",
+            begin,
+            end,
+        )
+        cache.set(key, duck_report)
+        with patch("data.fetch_db.stats_cache", cache):
+            with patch("data.duck_stats.duck_connection", side_effect=AssertionError):
+                assert DuckStats().get_report("moscow", begin, end) == cache.get(key)
+        open(duck_db.stale_marker(), "w").close()
+        with patch.object(GetStats, "compute_report", return_value={}) as mock_compute:
+            DuckStats().get_report("moscow", begin, end)
+        assert duck_db.refresh_mirror(synthetic_db) and not duck_db.is_stale()
+        connect, attempts = duck_db.duck_connection, []
+
+        def locked_once(read_only=True):
+            attempts.append(read_only)
+            if len(attempts) == 1:
+                raise duckdb.IOException("Database is locked")
+            return connect(read_only)
+
+        rows = synthetic_rows(["moscow"], today, today)
+        with patch.object(duck_db, "duck_connection", locked_once):
+            duck_db.mirror_rows([Stat(*row) for row in rows])
+        with duck_db.duck_connection() as connection:
+            count = connection.execute("SELECT count(*) FROM statistic")
+            assert count.fetchone()[0] == (today - first_day).days + 1
+        assert not duck_db.is_stale() and len(attempts) == 2
+    report = GetStats().get_report("moscow", begin, end)
+    mock_compute.assert_called_once()
+    assert mock_compute.call_args[0][0][0] == "GetStats"
+    for result in (report, duck_report):
+        result["common_weather"] = sorted(result["common_weather"])
+    assert duck_report == report
+
+
+def test_archive_chunks(file_engine):
+    """Tests archive chunks progress tracking, saving and retrying"""
+    file_session = sessionmaker(bind=file_engine)
+    rows = list(synthetic_rows(["moscow"], date(2020, 1, 1), date(2020, 12, 31)))
+    with patch.multiple(
+        archive,
+        writer_engine=file_engine,
+        Session=file_session,
+        WriterSession=file_session,
+    ):
+        chunks = archive.schedule_chunks()
+        archive.set_status("4368", 2020, archive.RUNNING)
+        archive.save_chunk("4368", 2020, rows[:10])
+        archive.save_chunk("4368", 2020, rows)
+        archive.set_status("4368", 2021, archive.RUNNING)
+        archive.set_status("4368", 2021, archive.FAILED, "HTTP 503")
+        archive.set_status("4368", 2019, archive.RETRYING, "HTTP 503")
+        with file_engine.connect() as writer:
+            writer.exec_driver_sql("BEGIN IMMEDIATE")
+            progress = archive.archive_progress()
+            writer.exec_driver_sql("ROLLBACK")
+        assert archive.retry_chunks() == [("4368", 2021)]
+        assert len(archive.schedule_chunks()) == len(chunks) - 2
+        archive.set_status("4368", 2018, archive.RUNNING)
+        with patch.object(archive, "chunk_timeout", -1):
+            assert archive.retry_chunks() == [("4368", 2018), ("4368", 2019)]
+    with file_engine.connect() as connection:
+        count = connection.execute("SELECT count(*) FROM statistic").scalar()
+    assert count == 366
+    assert progress["done"] == progress["failed"] == progress["retrying"] == 1
+    assert progress["pending"] == progress["total"] - 3 == len(chunks) - 3
+    assert not archive.is_complete(progress)
+    assert archive.is_complete({"total": 2, **dict.fromkeys(archive.OUTSTANDING, 0)})
+    assert progress["failures"][0]["attempts"] == 1
+
+
+def test_min_max_indices():
+    """Tests that min/max bucketing keeps extremes of every bucket in order"""
+    values = np.array([1, 5, 2, 3, 9, 0, 4, 4, 7, 6], dtype=float)
+    assert min_max_indices(values, 4).tolist() == [0, 4, 5, 8]
+    assert min_max_indices(values, 20).tolist() == list(range(10))
+
+
+def test_series(client, synthetic_db):
+    """Tests that series for long period are downsampled and keep extremes"""
+    url = f"/series/moscow?from=2015-01-01&until={last_day}&points=100"
+    series = client.get(url).json
+    with synthetic_db.connect() as connection:
+        hottest = connection.execute("SELECT max(max_temp) FROM statistic").scalar()
+    assert all(len(values["days"]) <= 100 for values in series.values())
+    assert len(series["precipitations"]["values"]) == 100
+    assert max(series["max_temp"]["values"]) == hottest
+    assert series["avg_temp"]["days"] == sorted(series["avg_temp"]["days"])
+
+
+def test_distribution(synthetic_db, tmp_path):
+    """
+    Tests that percentiles merged from month histograms and edge days are the
+    same as nearest-rank percentiles of period rows
+
+    """
+    with synthetic_db.connect() as connection:
+        max_temps = connection.execute(
+            "SELECT max_temp FROM statistic WHERE day BETWEEN ? AND ?",
+            ("2019-03-17", "2021-02-09"),
+        ).fetchall()
+    result = GetStats().get_distribution("moscow", "2019-03-17", "2021-02-09")
+    expected = np.sort([row[0] for row in max_temps])
+    for p in (10, 50, 90):
+        rank = int(np.ceil(p / 100 * len(expected)))
+        assert result["max_temp"][f"p{p}"] == expected[rank - 1]
+    assert sum(share for _, share in result["wind_distribution"]) == approx(
+        100, abs=0.1
+    )
+    assert percentile(Counter({1: 2, 5: 1, 3: 1}), 50) == 1
+    empty_engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    Base.metadata.create_all(empty_engine)
+    assert is_built(synthetic_db) and not is_built(empty_engine)
+    ensure_histograms(empty_engine)
+    assert is_built(empty_engine)
+
+
+def test_report_coalescing():
+    """Tests that concurrent requests for the same report share one computation"""
+    started, release = Event(), Event()
+
+    def compute_report(self, key):
+        started.set()
+        release.wait(5)
+        return {"key": list(key)}
+
+    with patch.object(GetStats, "compute_report", compute_report):
+        with patch("data.fetch_db.stats_cache", SharedCache(None, "stats")):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                args = ("moscow", "2020-01-01", "2020-12-31")
+                leader = pool.submit(GetStats().get_report, *args)
+                started.wait(5)
+                waiters = [pool.submit(GetStats().get_report, *args) for _ in range(7)]
+                sleep(0.1)
+                release.set()
+                results = [future.result() for future in [leader, *waiters]]
+    assert all(result is results[0] for result in results)
+
+
+def report_process(args: Tuple[str, ...]) -> Dict:
+    """Returns report for (city, begin, end) arguments in pool process"""
+    return GetStats().get_report(*args)
+
+
+def test_report_coalescing_processes(tmp_path):
+    """
+    Tests that concurrent requests for the same report in different processes
+    share one computation via cache key lock and shared cache
+
+    """
+    computations = tmp_path / "computations.log"
+    cache = SharedCache(str(tmp_path / "cache"), "stats")
+
+    def compute_report(self, key):
+        with open(computations, "a") as log:
+            log.write(f"{key}\n")
+        sleep(0.5)
+        cache.set(key, {"key": list(key)})
+        return {"key": list(key)}
+
+    args = ("moscow", "2020-01-01", "2020-12-31")
+    with patch.object(GetStats, "compute_report", compute_report):
+        with patch("data.fetch_db.stats_cache", cache):
+            with get_context("fork").Pool(4) as pool:
+                results = pool.map(report_process, [args] * 4)
+    assert all(result == results[0] for result in results)
+    assert len(computations.read_text().splitlines()) == 1
+    cache.invalidate()
+    assert not list((tmp_path / "cache" / "locks").iterdir())
+
+
+def test_single_flight_errors():
+    """Tests that waiting callers get computation error or timeout error"""
+    flights, started = SingleFlight(timeout=5), Event()
+
+    def fail():
+        started.set()
+        sleep(0.2)
+        raise ValueError("failed")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flights.do, "key", fail)
+        started.wait(5)
+        waiter = pool.submit(flights.do, "key", lambda: "not called")
+        for future in (leader, waiter):
+            with raises(ValueError):
+                future.result()
+    assert flights.do("key", lambda: "new") == "new"
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        started.clear()
+        slow_flights = SingleFlight(timeout=0.05)
+        pool.submit(slow_flights.do, "key", lambda: started.set() or sleep(0.3))
+        started.wait(5)
+        with raises(TimeoutError):
+            slow_flights.do("key", lambda: "not called")
+
+
+@mark.parametrize("chunk_size", [1, 512, 4096])
+def test_stream_parser(mock_page, chunk_size):
+    """Tests that page parsed by chunks gives the same rows as parse_data"""
+    with open("tests/mock_page.html", "rb") as page:
+        text = page.read()
+    parser = StreamParser()
+    for start in range(0, len(text), chunk_size):
+        if parser.feed(text[start : start + chunk_size]):
+            break
+    assert start + chunk_size < len(text)
+    assert parser.close() == list(parse_data(mock_page))
+    assert StreamParser().close() is None
+
+
+def test_periods(synthetic_db):
+    """
+    Tests that batch periods statistics are the same as statistics of every
+    period and number of queries doesn't depend on number of periods
+
+    """
+    statements = []
+    listen(synthetic_db, "before_cursor_execute", lambda *args: statements.append(1))
+    periods = recurring_periods([7], 2015, date(2021, 12, 31))
+    GetStats().get_periods("moscow", periods[:1])
+    single = len(statements)
+    result = GetStats().get_periods("moscow", periods)
+    assert len(statements) == 2 * single == 6
+    stats = GetStats()
+    for (begin, end), period in zip(periods, result):
+        assert period["from"] == begin and period["until"] == end
+        assert period["max_temp"] == stats.get_max_temp("moscow", begin, end)
+        assert period["min_temp"] == stats.get_min_temp("moscow", begin, end)
+        assert period["avg_temp"] == stats.get_avg_temp("moscow", begin, end)
+        assert period["wind_speed"] == stats.get_wind_speed("moscow", begin, end)
+        assert period["precipitations"] == stats.precipitations("moscow", begin, end)
+    empty = GetStats().get_periods("moscow", [("2009-07-01", "2009-07-31")])
+    assert empty[0]["max_temp"] is None and len(result) == 7
+    winters = recurring_periods([12, 1, 2], 2019, date(2021, 1, 10))
+    assert winters == [("2019-12-01", "2020-02-29"), ("2020-12-01", "2021-01-10")]
+    assert parse_periods("2020-07-01:2020-07-31") == [("2020-07-01", "2020-07-31")]
+    with raises(ValueError):
+        parse_periods("2020-07-31:2020-07-01")
+    for months in ([1, 12], [7, 7], [13], []):
+        with raises(ValueError):
+            recurring_periods(months)